@@ -0,0 +1,86 @@
+import argparse
+import random
+import resource
+import time
+import tracemalloc
+import pandas as pd
+import vertTirp.tirp.tirp
+from vertTirp.ti.ti2lstis import ti_read
+from vertTirp.vertTirp import VertTIRP
+
+# Memory benchmark of the vertTIRP pattern tree on a reference dataset
+# usage: python benchmark_memory.py [--sequences 300] [--intervals 60] [--symbols 10] [--min-sup 0.3] [--max-gap 3600]
+# the reference dataset is generated with a fixed seed, so runs on different versions of the miner are comparable.
+# reports the mining time and the peak RSS before and after mining, and from a second, traced (slower) mining of the same
+# sequences: the bytes per tirp instance (the memory that is allocated in tirp.py when extending a tirp and is still
+# alive after mining), the bytes of the whole pattern tree and the bytes per time interval of the input sequences
+
+
+# sequences of random intervals, like the binned intervals that server.mine_seqs passes to ti_read
+def reference_data(sequences, intervals, symbols, seed):
+    rng = random.Random(seed)
+    names = [chr(ord('A') + i) for i in range(symbols)]
+    rows = []
+    for sid in range(sequences):
+        start = 0
+        for _ in range(intervals):
+            start += rng.randint(1, 30) * 60
+            rows.append((sid, start, start + rng.randint(1, 20) * 60, rng.choice(names)))
+    df = pd.DataFrame(rows, columns=['sid', 'start_time', 'end_time', 'value'])
+    for column in ['start_time', 'end_time']:
+        df[column] = pd.to_datetime(df[column], unit='s').dt.strftime('%Y/%m/%d %H:%M:%S')
+    return df.sort_values(by=['start_time', 'end_time']).reset_index(drop=True)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the memory used by the tirp instances of a mined tree")
+    parser.add_argument("--sequences", type=int, default=300, help="number of sequences of the reference dataset")
+    parser.add_argument("--intervals", type=int, default=60, help="number of intervals per sequence")
+    parser.add_argument("--symbols", type=int, default=10, help="number of interval types")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--min-sup", type=float, default=0.3, help="relative minimum vertical support")
+    parser.add_argument("--max-gap", type=int, default=3600, help="maximum gap in seconds")
+    parser.add_argument("--max-length", type=int, default=-1, help="maximum pattern length, -1 for no maximum")
+    args = parser.parse_args()
+    params = dict(time_mode=1, min_sup_rel=args.min_sup, max_gap=args.max_gap, max_length=args.max_length, eps=0)
+    df = reference_data(args.sequences, args.intervals, args.symbols, args.seed)
+
+    tracemalloc.start()
+    list_of_ti_seqs, list_of_seqs, ti_count = ti_read(df)
+    input_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    rss_before = peak_rss_mb()
+    co = VertTIRP(**params)
+    start = time.time()
+    tirp_count = co.mine_patterns(list_of_ti_seqs, list_of_seqs, False)
+    elapsed = time.time() - start
+    rss_after = peak_rss_mb()
+    del co
+
+    tracemalloc.start(10)
+    co = VertTIRP(**params)
+    co.mine_patterns(list_of_ti_seqs, list_of_seqs, False)
+    tree_bytes = tracemalloc.get_traced_memory()[0]
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # the tirps of at least two time intervals are created by TIRP.extend_with
+    extended = snapshot.filter_traces([tracemalloc.Filter(True, vertTirp.tirp.tirp.__file__, all_frames=True)])
+    instance_bytes = sum(trace.size for trace in extended.traces)
+    instances = {}
+    for symbols, rel, sidlist, tirp_stat in co.get_occurrences():
+        if len(symbols) > 1:
+            for sid, tirp in tirp_stat.get_instances():
+                instances[id(tirp)] = tirp
+
+    print("mined", tirp_count, "tirps with", len(instances), "instances of 2 or more time intervals in",
+          round(elapsed, 2), "s")
+    print("peak RSS before mining:", round(rss_before, 1), "MB, after mining:", round(rss_after, 1), "MB")
+    print("bytes per tirp instance:", round(instance_bytes / max(len(instances), 1), 1))
+    print("bytes of the pattern tree:", tree_bytes)
+    print("bytes per input time interval:", round(input_bytes / max(ti_count, 1), 1))
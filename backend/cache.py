@@ -0,0 +1,169 @@
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+import numpy as np
+import pandas as pd
+
+# Memoization of the functions in server.py that build dataframes.
+# All memoized functions share one cache with a budget in bytes: the size of every result is estimated when it is
+# stored, and entries are evicted (least recently used or least frequently used first) until the cache fits the budget.
+# Entries can also be dropped selectively, e.g. only the results that include a user whose data has changed.
+# Per function, the number of hits, misses and evictions is counted, see stats().
+
+DEFAULT_BUDGET = 2 * 1024 ** 3
+
+
+# estimate the memory used by a cached result in bytes
+def estimate_size(obj):
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray) or hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(estimate_size(x) for x in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    return sys.getsizeof(obj)
+
+
+class ByteBudgetCache:
+    """
+    A cache of (function name, arguments) -> result with a budget in bytes.
+    policy 'lru' evicts the least recently used entry, 'lfu' the entry with the fewest hits
+    (the least recently used one of those in case of a tie).
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, policy='lru'):
+        self.budget = budget
+        self.policy = policy
+        self.size = 0
+        # key -> [result, size in bytes, hits], ordered from least to most recently used
+        self.entries = OrderedDict()
+        # function name -> counters
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def register(self, name):
+        self.counters[name] = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'uncacheable': 0}
+
+    def get(self, name, args):
+        key = (name, args)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters[name]['misses'] += 1
+                return False, None
+            entry[2] += 1
+            self.entries.move_to_end(key)
+            self.counters[name]['hits'] += 1
+            return True, entry[0]
+
+    def put(self, name, args, result):
+        size = estimate_size(result)
+        key = (name, args)
+        with self.lock:
+            if size > self.budget:
+                self.counters[name]['uncacheable'] += 1
+                return
+            if key in self.entries:
+                self.remove(key)
+            while self.size + size > self.budget and len(self.entries) > 0:
+                victim = self.victim()
+                self.remove(victim)
+                self.counters[victim[0]]['evictions'] += 1
+            self.entries[key] = [result, size, 0]
+            self.size += size
+
+    def victim(self):
+        if self.policy == 'lfu':
+            # min keeps the first of equal entries, which is the least recently used one
+            return min(self.entries, key=lambda key: self.entries[key][2])
+        return next(iter(self.entries))
+
+    def remove(self, key):
+        self.size -= self.entries.pop(key)[1]
+
+    def invalidate(self, predicate, name=None):
+        with self.lock:
+            for key in [key for key in self.entries if (name is None or key[0] == name) and predicate(key[1])]:
+                self.remove(key)
+                self.counters[key[0]]['invalidations'] += 1
+
+    def clear(self, name=None):
+        self.invalidate(lambda args: True, name)
+
+    def resize(self, budget=None, policy=None):
+        with self.lock:
+            if policy is not None:
+                self.policy = policy
+            if budget is not None:
+                self.budget = budget
+            while self.size > self.budget and len(self.entries) > 0:
+                victim = self.victim()
+                self.remove(victim)
+                self.counters[victim[0]]['evictions'] += 1
+
+    def stats(self):
+        with self.lock:
+            functions = {name: dict(counters, entries=0, bytes=0) for name, counters in self.counters.items()}
+            for (name, _), (_, size, _) in self.entries.items():
+                functions[name]['entries'] += 1
+                functions[name]['bytes'] += size
+            return {'budget': self.budget, 'bytes': self.size, 'policy': self.policy, 'functions': functions}
+
+
+shared_cache = ByteBudgetCache()
+
+
+def memoize():
+    def decorator(func):
+        name = func.__name__
+        shared_cache.register(name)
+
+        @wraps(func)
+        def wrapper(*args):
+            found, result = shared_cache.get(name, args)
+            if found:
+                return result
+            result = func(*args)
+            shared_cache.put(name, args, result)
+            return result
+
+        # drop the entries of this function for which predicate(args) is True
+        wrapper.invalidate = lambda predicate: shared_cache.invalidate(predicate, name)
+        wrapper.cache_clear = lambda: shared_cache.clear(name)
+        return wrapper
+    return decorator
+
+
+# results that are not returned by a memoized function (e.g. by-products of a computation) can be kept in the shared
+# cache as well, under a registered name
+def register(name):
+    shared_cache.register(name)
+
+
+def put(name, args, result):
+    shared_cache.put(name, args, result)
+
+
+# returns (found, result)
+def get(name, args):
+    return shared_cache.get(name, args)
+
+
+# drop the entries of all memoized functions for which predicate(args) is True
+def invalidate(predicate):
+    shared_cache.invalidate(predicate)
+
+
+# set the byte budget and/or the eviction policy ('lru' or 'lfu') of the shared cache
+def configure(budget=None, policy=None):
+    shared_cache.resize(budget, policy)
+
+
+# hit, miss, eviction and invalidation counters, number of entries and bytes per memoized function
+def stats():
+    return shared_cache.stats()
@@ -0,0 +1,156 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import intervalstore
+
+# Ingest the data of a data directory into the columnar interval store that is read by server.py
+# usage: python ingest.py <data_directory> <store_directory> [--users 1,2,3] [--from-timedata]
+# with --from-timedata, the intervaldata.pickle of every user is first (re)created from its timedata.pickle
+#
+# new uploads are added with: python ingest.py <data_directory> <store_directory> --append <upload_directory>
+# where the upload directory has a subdirectory with a timedata.pickle of new readings per user
+
+
+# convert the raw sensor readings of one user (participantId, measuredAt, event, value) into intervals.
+# readings are compared per minute, like dummydata.get_event_intervals: every reading of an event starts an interval
+# that ends at the first reading of that event at the next distinct minute, e.g. 'powerState/screen_off/screen_on'.
+# all users, events and readings are handled with sorted array operations instead of row loops.
+def timedata_to_intervals(timedata, user, events=None):
+    if events is not None:
+        timedata = timedata[timedata['event'].isin(events)]
+    measured = pd.to_datetime(timedata['measuredAt'], utc=False)
+    df = pd.DataFrame({'event': timedata['event'].astype(str).values,
+                       'measuredAt': measured.values,
+                       'value': timedata['value'].astype(str).values})
+    df = df.sort_values(['event', 'measuredAt'], kind='mergesort').reset_index(drop=True)
+
+    minutes = df['measuredAt'].dt.floor('min')
+    event = df['event'].values
+    t = minutes.values
+    # a group is a run of readings of the same event at the same minute
+    new_group = np.ones(len(df), dtype=bool)
+    new_group[1:] = (t[1:] != t[:-1]) | (event[1:] != event[:-1])
+    group = np.cumsum(new_group) - 1
+    group_first = np.flatnonzero(new_group)
+
+    # the first reading of the next group is the end of the interval, if it belongs to the same event
+    next_group = group + 1
+    has_next = next_group < len(group_first)
+    rows = np.flatnonzero(has_next)
+    ends = group_first[next_group[rows]]
+    same_event = event[rows] == event[ends]
+    rows, ends = rows[same_event], ends[same_event]
+
+    time_format = "%Y/%m/%d %H:%M"
+    values = df['value'].values
+    return pd.DataFrame({
+        'sid': user,
+        'start_time': minutes.iloc[rows].dt.strftime(time_format).values,
+        'end_time': minutes.iloc[ends].dt.strftime(time_format).values,
+        'value': event[rows] + "/" + values[rows] + "/" + values[ends]
+    }, columns=['sid', 'start_time', 'end_time', 'value'])
+
+
+# the readings at the last minute of every event. These do not start an interval yet,
+# their intervals end at the first readings of the next upload
+def last_readings(timedata):
+    minutes = pd.to_datetime(timedata['measuredAt'], utc=False).dt.floor('min')
+    last = minutes.groupby(timedata['event'].values).transform('max')
+    return timedata[(minutes == last).values]
+
+
+# read the timedata.pickle of a user and write its intervaldata.pickle, returns the number of intervals
+def convert_user(data_directory, user, events=None):
+    timedata = pd.read_pickle(os.path.join(data_directory, user, 'timedata.pickle'))
+    intervaldata = timedata_to_intervals(timedata, user, events)
+    intervaldata.to_pickle(os.path.join(data_directory, user, 'intervaldata.pickle'))
+    last_readings(timedata).to_pickle(os.path.join(data_directory, user, 'timedata_tail.pickle'))
+    return len(intervaldata)
+
+
+# add the new readings of a user in upload_directory to the timedata and intervaldata of the user in data_directory.
+# the last readings of the previous upload are converted together with the new readings, so intervals that continue
+# across the upload boundary are created as well. Returns the new intervals
+def append_user(data_directory, upload_directory, user, events=None):
+    user_directory = os.path.join(data_directory, user)
+    os.makedirs(user_directory, exist_ok=True)
+    new = pd.read_pickle(os.path.join(upload_directory, user, 'timedata.pickle'))
+
+    timedata_path = os.path.join(user_directory, 'timedata.pickle')
+    tail_path = os.path.join(user_directory, 'timedata_tail.pickle')
+    timedata = pd.read_pickle(timedata_path) if os.path.exists(timedata_path) else None
+    if os.path.exists(tail_path):
+        tail = pd.read_pickle(tail_path)
+    elif timedata is not None:
+        tail = last_readings(timedata)
+    else:
+        tail = new.iloc[:0]
+    readings = pd.concat([tail, new])
+    intervals = timedata_to_intervals(readings, user, events)
+
+    pd.concat([timedata, new]).to_pickle(timedata_path)
+    intervaldata_path = os.path.join(user_directory, 'intervaldata.pickle')
+    if os.path.exists(intervaldata_path):
+        pd.concat([pd.read_pickle(intervaldata_path), intervals]).to_pickle(intervaldata_path)
+    else:
+        intervals.to_pickle(intervaldata_path)
+    last_readings(readings).to_pickle(tail_path)
+    return intervals
+
+
+# convert the timedata of all users in a process pool
+def convert_users(data_directory, users=None, events=None, workers=None):
+    if users is None:
+        users = sorted(u for u in os.listdir(data_directory)
+                       if os.path.exists(os.path.join(data_directory, u, 'timedata.pickle')))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(convert_user, [data_directory] * len(users), users, [events] * len(users))
+        return dict(zip(users, counts))
+
+
+# append the uploads of all users in upload_directory, the conversion runs in a process pool,
+# after which the partitions of the uploading users are appended to in the store
+def append_uploads(data_directory, store_directory, upload_directory, users=None, events=None, workers=None):
+    if users is None:
+        users = sorted(u for u in os.listdir(upload_directory)
+                       if os.path.exists(os.path.join(upload_directory, u, 'timedata.pickle')))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        intervals = pool.map(append_user, [data_directory] * len(users), [upload_directory] * len(users), users,
+                             [events] * len(users))
+        intervals = dict(zip(users, intervals))
+    intervalstore.append_intervals(store_directory, intervals)
+    return intervals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert interval data into the columnar interval store")
+    parser.add_argument("data_directory", help="directory with a subdirectory (containing intervaldata.pickle) per user")
+    parser.add_argument("store_directory", help="directory in which the columnar store is written")
+    parser.add_argument("--users", default=None, help="comma separated list of users to (re)ingest, default all")
+    parser.add_argument("--from-timedata", action="store_true",
+                        help="first create intervaldata.pickle from the timedata.pickle of every user")
+    parser.add_argument("--events", default=None, help="comma separated list of events to convert, default all")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes used for the conversion")
+    parser.add_argument("--append", default=None, metavar="UPLOAD_DIRECTORY",
+                        help="append the new readings in UPLOAD_DIRECTORY/<user>/timedata.pickle to the store")
+    args = parser.parse_args()
+
+    users = args.users.split(',') if args.users else None
+    events = args.events.split(',') if args.events else None
+    start = time.time()
+    if args.append:
+        intervals = append_uploads(args.data_directory, args.store_directory, args.append, users, events, args.workers)
+        print("appended", sum(len(df) for df in intervals.values()), "intervals for", len(intervals), "users in",
+              round(time.time() - start, 2), "s")
+    else:
+        if args.from_timedata:
+            counts = convert_users(args.data_directory, users, events, args.workers)
+            print("converted", len(counts), "users,", sum(counts.values()), "intervals in",
+                  round(time.time() - start, 2), "s")
+            users = list(counts) if users is None else users
+        manifest = intervalstore.build_store(args.data_directory, args.store_directory, users)
+        print("ingested", len(manifest), "users,", sum(e['rows'] for e in manifest.values()), "intervals in",
+              round(time.time() - start, 2), "s")
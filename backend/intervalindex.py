@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+# Interval index used by server.query
+#
+# The binned intervals of a selection are indexed per sequence (sid) and per value: for every value in a sequence the
+# start times, end times and eids of its intervals are kept in arrays sorted on start time, so the intervals of a value
+# that start within a time range are found with a binary search instead of a scan over the whole sequence.
+# Times are int64 nanoseconds since the epoch. relation_kernel matches all intervals of two values at once.
+
+MINUTE = 60 * 10 ** 9
+SECOND = 10 ** 9
+
+
+# datetime column as int64 nanoseconds (wall time for columns without time zone)
+def to_ns(column):
+    return pd.DatetimeIndex(pd.to_datetime(column, errors='coerce')).asi8
+
+
+RELATIONS = 'bmcofes'
+
+
+# all pairs (i, j) with j in the range [low[i], high[i]), ordered on i and then j
+def expand_ranges(low, high):
+    counts = np.maximum(high - low, 0)
+    pair_first = np.repeat(np.arange(len(low)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return pair_first, np.repeat(low, counts) + offsets
+
+
+def relation_kernel(first_start, first_end, second_start, second_end, relation, maxg):
+    """
+    Matches all intervals of one value with all intervals of another value at once. For every first interval the
+    candidate second intervals lie in a bounded range of start times, which is found with a binary search on the sorted
+    start times of the second intervals. The candidates are then checked in one vectorized comparison.
+
+    :param first_start: int64 start times of the first intervals
+    :param first_end: int64 end times of the first intervals
+    :param second_start: int64 start times of the second intervals, sorted
+    :param second_end: int64 end times of the second intervals
+    :param relation: one of the relations b, m, c, o, f, e, s
+    :param maxg: maximum gap in seconds for the before relation
+    :return: two index arrays into the first and second intervals with a pair per match, ordered on the first
+    interval and then on the second, except for 'e', where the pairs are ordered like an inner merge on (start, end)
+    """
+    if relation == 'b':
+        # second interval starts after the end of the first, within maxg seconds
+        low = np.searchsorted(second_start, first_end, side='right')
+        high = np.searchsorted(second_start, first_end + maxg * SECOND, side='left')
+        return expand_ranges(low, high)
+    if relation == 'm':
+        # second interval starts in the minute in which the first ends
+        minute = first_end // MINUTE * MINUTE
+        return expand_ranges(np.searchsorted(second_start, minute), np.searchsorted(second_start, minute + MINUTE))
+    if relation == 's':
+        # second interval starts in the same minute as the first and ends after it
+        minute = first_start // MINUTE * MINUTE
+        pair_first, pair_second = expand_ranges(np.searchsorted(second_start, minute),
+                                                np.searchsorted(second_start, minute + MINUTE))
+        keep = second_end[pair_second] > first_end[pair_first]
+        return pair_first[keep], pair_second[keep]
+    if relation == 'e':
+        # same start and end time
+        pair_first, pair_second = expand_ranges(np.searchsorted(second_start, first_start, side='left'),
+                                                np.searchsorted(second_start, first_start, side='right'))
+        keep = second_end[pair_second] == first_end[pair_first]
+        pair_first, pair_second = pair_first[keep], pair_second[keep]
+        # pairs are grouped per (start, end) of the first interval, in order of appearance
+        group = pd.MultiIndex.from_arrays([first_start, first_end]).factorize()[0]
+        order = np.argsort(group[pair_first], kind='stable')
+        return pair_first[order], pair_second[order]
+    # c, o, f: second interval starts while the first is running, and ends before, after or in the same minute
+    pair_first, pair_second = expand_ranges(np.searchsorted(second_start, first_start, side='right'),
+                                            np.searchsorted(second_start, first_end, side='left'))
+    ends, first_ends = second_end[pair_second], first_end[pair_first]
+    if relation == 'c':
+        keep = ends < first_ends
+    elif relation == 'o':
+        keep = ends > first_ends
+    elif relation == 'f':
+        keep = ends // MINUTE == first_ends // MINUTE
+    else:
+        keep = np.zeros(len(pair_first), dtype=bool)
+    return pair_first[keep], pair_second[keep]
+
+
+class SequenceIndex:
+    """
+    The intervals of one sequence, sorted on start time like query sorts them.
+    values maps every value to (positions, start times, end times, eids) of its intervals, in order of start time,
+    where positions are the positions of the intervals in the sorted sequence.
+    """
+
+    def __init__(self, start, end, eid, value):
+        self.length = len(start)
+        self.values = {}
+        codes, uniques = pd.factorize(value)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))
+        for code, positions in enumerate(np.split(order[codes[order] >= 0], bounds[:-1])):
+            self.values[uniques[code]] = (positions, start[positions], end[positions], eid[positions])
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for arrays in self.values.values() for array in arrays)
+
+    def relation_pairs(self, first_element, second_element, relation, maxg):
+        """
+        Finds all pairs of intervals of first_element and second_element that are in the given relation.
+
+        :param first_element: value of the first interval
+        :param second_element: value of the second interval
+        :param relation: one of the relations b, m, c, o, f, e, s
+        :param maxg: maximum gap in seconds for the before relation
+        :return: two arrays with the eids of the first and the second interval of every pair
+        """
+        if first_element not in self.values or second_element not in self.values:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        first, second = self.pairs(first_element, second_element, relation, maxg)
+        return self.values[first_element][3][first], self.values[second_element][3][second]
+
+    def pairs(self, first_element, second_element, relation, maxg):
+        # indices of the pairs into the interval arrays of both values, see relation_kernel
+        first, second = self.values[first_element], self.values[second_element]
+        if relation not in ('m', 'e'):
+            # the last interval of the sequence is never the first interval of a relation
+            first = tuple(array[first[0] != self.length - 1] for array in first)
+            pair_first, pair_second = relation_kernel(first[1], first[2], second[1], second[2], relation, maxg)
+            return np.flatnonzero(self.values[first_element][0] != self.length - 1)[pair_first], pair_second
+        return relation_kernel(first[1], first[2], second[1], second[2], relation, maxg)
+
+    def relation_ids(self, first_element, second_element, relation, maxg):
+        """
+        Finds the intervals of first_element and second_element that are in the given relation.
+
+        :param first_element: value of the first interval
+        :param second_element: value of the second interval
+        :param relation: one of the relations b, m, c, o, f, e, s
+        :param maxg: maximum gap in seconds for the before relation
+        :return: the eids of the first intervals and the eids of the second intervals that are in the relation,
+        in the order in which query used to list them
+        """
+        if first_element not in self.values or second_element not in self.values or relation not in RELATIONS:
+            return [], []
+        first_eid, second_eid = self.values[first_element][3], self.values[second_element][3]
+        pair_first, pair_second = self.pairs(first_element, second_element, relation, maxg)
+
+        if relation == 'e':
+            if first_element == second_element:
+                # the pair is selected as a whole when both intervals have the same value
+                ids = np.column_stack([first_eid[pair_first], second_eid[pair_second]]).ravel().tolist()
+                return ids, list(ids)
+            return first_eid[pair_first].tolist(), second_eid[pair_second].tolist()
+        if relation == 'm':
+            # every interval that takes part in a pair, once
+            return first_eid[np.unique(pair_first)].tolist(), second_eid[np.unique(pair_second)].tolist()
+        # every first interval with at least one pair, followed by all its second intervals
+        return first_eid[np.unique(pair_first)].tolist(), second_eid[pair_second].tolist()
+
+
+class IntervalIndex:
+    """
+    Index of the intervals of a set of sequences, with one SequenceIndex per sid in order of appearance.
+    data needs the columns sid, start_time, end_time, value and eid.
+    """
+
+    def __init__(self, data):
+        codes, self.sids = pd.factorize(data['sid'])
+        start = to_ns(data['start_time'])
+        end = to_ns(data['end_time'])
+        eid = data['eid'].to_numpy()
+        value = data['value'].to_numpy()
+
+        self.sequences = []
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(self.sids)))
+        for rows in np.split(order[codes[order] >= 0], bounds[:-1]):
+            # same ordering as sort_values(by='start_time') on the rows of the sequence
+            rows = rows[np.argsort(start[rows], kind='quicksort')]
+            self.sequences.append(SequenceIndex(start[rows], end[rows], eid[rows], value[rows]))
+
+    @property
+    def nbytes(self):
+        return sum(sequence.nbytes for sequence in self.sequences)
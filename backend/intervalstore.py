@@ -0,0 +1,394 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Columnar interval store
+#
+# The store replaces the per-user intervaldata.pickle files with typed column files:
+#   <store>/dictionary.json      dictionary encoding of the 'value' and 'event' columns
+#   <store>/manifest.json        per-user row count, time range and value codes (used to skip partitions)
+#   <store>/<user>/<column>.npy  one file per column for every user partition
+#   <store>/consolidated.json    offset index of the consolidated file: {'file': ..., 'index': {user: [offset, rows]}}
+#   <store>/intervals-<n>.npy    all partitions in one file, sorted by (user, start_time), read memory-mapped
+# start_time and end_time are int64 epoch seconds (UTC), duration is the precomputed duration in minutes,
+# value and event are int32 codes into dictionary.json.
+
+COLUMNS = {
+    'start_time': np.int64,
+    'end_time': np.int64,
+    'duration': np.float64,
+    'value': np.int32,
+    'event': np.int32
+}
+
+# the columns returned by read_intervals, in the same order as the frames built from the pickle files
+FRAME_COLUMNS = ['sid', 'start_time', 'end_time', 'value', 'event', 'eid', 'duration']
+
+# row layout of the consolidated file, 'row' is the position of the row in its user partition (used for the eid)
+CONSOLIDATED_DTYPE = np.dtype([(name, dtype) for name, dtype in COLUMNS.items()] + [('row', np.int64)])
+
+# number of threads used to read user partitions, reading is mostly waiting on disk and numpy releases the GIL
+LOAD_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def has_store(store_directory):
+    return os.path.exists(os.path.join(store_directory, 'manifest.json'))
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, obj):
+    # write to a temporary file first, so that readers never see a half written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def load_dictionary(store_directory):
+    return read_json(os.path.join(store_directory, 'dictionary.json'), {'value': [], 'event': []})
+
+
+def load_manifest(store_directory):
+    return read_json(os.path.join(store_directory, 'manifest.json'), {})
+
+
+# dictionary encode the strings in values, new strings are appended to the codes list
+def encode(values, codes):
+    lookup = {v: i for i, v in enumerate(codes)}
+    uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    mapping = np.empty(len(uniques), dtype=np.int32)
+    for i, v in enumerate(uniques):
+        if v not in lookup:
+            lookup[v] = len(codes)
+            codes.append(v)
+        mapping[i] = lookup[v]
+    return mapping[inverse]
+
+
+# convert an intervaldata frame (sid, start_time, end_time, value) into typed columns
+def to_columns(df, dictionary):
+    start = pd.to_datetime(df['start_time'], utc=True)
+    end = pd.to_datetime(df['end_time'], utc=True)
+    start_time = start.values.astype('datetime64[s]').astype(np.int64)
+    end_time = end.values.astype('datetime64[s]').astype(np.int64)
+    values = df['value'].astype(str).values
+    return {
+        'start_time': start_time,
+        'end_time': end_time,
+        'duration': np.floor_divide(end_time - start_time, 60).astype(np.float64),
+        'value': encode(values, dictionary['value']),
+        'event': encode([v.split('/')[0] for v in values], dictionary['event'])
+    }
+
+
+# write the columns of one user partition and return its manifest entry.
+# every column is written to a temporary file first, so that readers never see a half written column.
+# the version of the partition is increased on every write, the server uses it to drop cached results of the user
+def write_partition(store_directory, user, columns, previous=None):
+    path = os.path.join(store_directory, user)
+    os.makedirs(path, exist_ok=True)
+    for name, dtype in COLUMNS.items():
+        tmp_path = os.path.join(path, name + '.tmp.npy')
+        np.save(tmp_path, np.asarray(columns[name], dtype=dtype))
+        os.replace(tmp_path, os.path.join(path, name + '.npy'))
+    rows = len(columns['start_time'])
+    return {
+        'rows': rows,
+        'first_start': int(columns['start_time'].min()) if rows else None,
+        'last_end': int(columns['end_time'].max()) if rows else None,
+        'values': sorted(int(v) for v in np.unique(columns['value'])),
+        'version': previous.get('version', 0) + 1 if previous else 0
+    }
+
+
+# write the dictionary, the consolidated file and finally the manifest.
+# the manifest is written last, because a changed manifest makes the server drop the cached results of the changed users
+def commit_store(store_directory, dictionary, manifest):
+    write_json(os.path.join(store_directory, 'dictionary.json'), dictionary)
+    consolidate(store_directory, manifest)
+    write_json(os.path.join(store_directory, 'manifest.json'), manifest)
+
+
+# ingest step: convert the intervaldata.pickle of every user in data_directory into the columnar store
+def build_store(data_directory, store_directory, users=None):
+    os.makedirs(store_directory, exist_ok=True)
+    dictionary = load_dictionary(store_directory)
+    manifest = load_manifest(store_directory)
+    if users is None:
+        users = sorted(u for u in os.listdir(data_directory)
+                       if os.path.exists(os.path.join(data_directory, u, 'intervaldata.pickle')))
+    for user in users:
+        df = pd.read_pickle(os.path.join(data_directory, user, 'intervaldata.pickle'))
+        manifest[user] = write_partition(store_directory, user, to_columns(df, dictionary), manifest.get(user))
+    commit_store(store_directory, dictionary, manifest)
+    return manifest
+
+
+# append new intervals ({user: intervaldata frame}) to the partitions of their users.
+# only the partitions of these users are rewritten, the partitions of all other users are left untouched
+def append_intervals(store_directory, intervals):
+    os.makedirs(store_directory, exist_ok=True)
+    dictionary = load_dictionary(store_directory)
+    manifest = load_manifest(store_directory)
+    for user, df in intervals.items():
+        new = to_columns(df, dictionary)
+        if user in manifest:
+            path = os.path.join(store_directory, user)
+            old = {name: np.load(os.path.join(path, name + '.npy')) for name in COLUMNS}
+            new = {name: np.concatenate([old[name], new[name].astype(dtype)]) for name, dtype in COLUMNS.items()}
+        manifest[user] = write_partition(store_directory, user, new, manifest.get(user))
+    commit_store(store_directory, dictionary, manifest)
+    return manifest
+
+
+# the version of every user partition, see write_partition
+def load_versions(store_directory):
+    return {user: entry.get('version', 0) for user, entry in load_manifest(store_directory).items()}
+
+
+# write all user partitions into one file, sorted by (user, start_time), with a per-user offset index.
+# the file gets a new name on every run and the index is replaced atomically, so processes that still
+# have the previous file mapped keep reading a consistent version until they reopen the store
+def consolidate(store_directory, manifest=None):
+    if manifest is None:
+        manifest = load_manifest(store_directory)
+    previous = read_json(os.path.join(store_directory, 'consolidated.json'), None)
+    generation = previous['generation'] + 1 if previous else 0
+    file_name = 'intervals-%d.npy' % generation
+
+    users = sorted(manifest)
+    total = sum(manifest[u]['rows'] for u in users)
+    out = np.lib.format.open_memmap(os.path.join(store_directory, file_name), mode='w+',
+                                    dtype=CONSOLIDATED_DTYPE, shape=(total,))
+    index = {}
+    offset = 0
+    for user in users:
+        rows = manifest[user]['rows']
+        if rows > 0:
+            data = {name: np.load(os.path.join(store_directory, user, name + '.npy')) for name in COLUMNS}
+            order = np.argsort(data['start_time'], kind='stable')
+            block = out[offset:offset + rows]
+            for name in COLUMNS:
+                block[name] = data[name][order]
+            block['row'] = order
+        index[user] = [offset, rows]
+        offset += rows
+    out.flush()
+    del out
+
+    write_json(os.path.join(store_directory, 'consolidated.json'),
+               {'generation': generation, 'file': file_name, 'index': index})
+    if previous and os.path.exists(os.path.join(store_directory, previous['file'])):
+        os.remove(os.path.join(store_directory, previous['file']))
+
+
+def has_consolidated(store_directory):
+    return os.path.exists(os.path.join(store_directory, 'consolidated.json'))
+
+
+# the consolidated file is mapped once per process and remapped when a new version has been written,
+# all workers on a machine share its pages through the page cache
+mapped_files = {}
+
+def open_consolidated(store_directory):
+    path = os.path.join(store_directory, 'consolidated.json')
+    if not os.path.exists(path):
+        return None
+    mtime = os.stat(path).st_mtime_ns
+    mapped = mapped_files.get(store_directory)
+    if mapped is None or mapped[0] != mtime:
+        consolidated = read_json(path, None)
+        array = np.load(os.path.join(store_directory, consolidated['file']), mmap_mode='r')
+        mapped = (mtime, consolidated['index'], array)
+        mapped_files[store_directory] = mapped
+    return mapped[1], mapped[2]
+
+
+# check whether a partition can contain rows that pass the predicates, based on the manifest only
+def partition_matches(entry, value_codes, start, end):
+    if entry['rows'] == 0:
+        return False
+    if value_codes is not None and not set(entry['values']).intersection(value_codes):
+        return False
+    if start is not None and entry['last_end'] < start:
+        return False
+    if end is not None and entry['first_start'] > end:
+        return False
+    return True
+
+
+# read the requested columns of one user partition, rows are filtered on the predicates
+def read_partition(store_directory, user, columns, value_codes=None, start=None, end=None):
+    path = os.path.join(store_directory, user)
+    needed = set(columns)
+    if value_codes is not None:
+        needed.add('value')
+    if start is not None:
+        needed.add('end_time')
+    if end is not None:
+        needed.add('start_time')
+    data = {name: np.load(os.path.join(path, name + '.npy')) for name in needed}
+    return filter_rows(data, columns, value_codes, start, end)
+
+
+# filter the rows of the columns in data on the predicates, returns the requested columns and the row numbers
+def filter_rows(data, columns, value_codes=None, start=None, end=None):
+    n = len(next(iter(data.values()))) if data else 0
+    mask = np.ones(n, dtype=bool)
+    if value_codes is not None:
+        mask &= np.isin(data['value'], value_codes)
+    if start is not None:
+        mask &= data['end_time'] >= start
+    if end is not None:
+        mask &= data['start_time'] <= end
+    rows = np.flatnonzero(mask)
+    return {name: data[name][rows] for name in columns}, rows
+
+
+# slice the rows of one user from the consolidated file, the slice and its columns are views on the mapped file.
+# rows are sorted on start_time, so the end predicate is a binary search
+def read_consolidated(array, offset, rows, columns, value_codes=None, start=None, end=None):
+    block = array[offset:offset + rows]
+    if end is not None:
+        block = block[:np.searchsorted(block['start_time'], end, side='right')]
+    if value_codes is not None or start is not None:
+        mask = np.ones(len(block), dtype=bool)
+        if value_codes is not None:
+            mask &= np.isin(block['value'], value_codes)
+        if start is not None:
+            mask &= block['end_time'] >= start
+        block = block[mask]
+    return {name: block[name] for name in columns}, block['row']
+
+
+# run load(user) for every user in a thread pool, the results are returned in the order of users.
+# if timings is a dict, it is filled with the load time in seconds of each user
+def load_parallel(load, users, timings=None):
+    def timed_load(user):
+        start = time.perf_counter()
+        result = load(user)
+        return result, time.perf_counter() - start
+
+    if len(users) > 1:
+        with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(users))) as pool:
+            results = list(pool.map(timed_load, users))
+    else:
+        results = [timed_load(user) for user in users]
+    if timings is not None:
+        for user, (_, seconds) in zip(users, results):
+            timings[user] = seconds
+    return [result for result, _ in results]
+
+
+# load the intervals of the selected users as a dataframe in the get_intervaldata format
+# only the columns in 'columns' are read from disk (column pushdown) and partitions and rows that do not
+# match the selected values or the [start, end] time range in epoch seconds are skipped (predicate pushdown).
+# eids are the row numbers in the unfiltered concatenation of the users, so they do not depend on the predicates.
+# users that are not in the store (yet) are read from their intervaldata.pickle in data_directory
+def read_intervals(store_directory, users, columns=None, values=None, start=None, end=None, timings=None,
+                   data_directory=None):
+    if columns is None:
+        columns = FRAME_COLUMNS
+    dictionary = load_dictionary(store_directory)
+    manifest = load_manifest(store_directory)
+    # the values of the users that are read from their pickle are added to the dictionary (in memory only)
+    unstored = read_unstored(data_directory, [u for u in users if u not in manifest], dictionary)
+    value_codes = None
+    if values is not None:
+        lookup = {v: i for i, v in enumerate(dictionary['value'])}
+        value_codes = np.array([lookup[v] for v in values if v in lookup], dtype=np.int32)
+
+    # the row counts of the consolidated file are used when it exists, the manifest is written after it
+    consolidated = open_consolidated(store_directory)
+    if consolidated is not None:
+        sizes = {user: rows for user, (_, rows) in consolidated[0].items()}
+    else:
+        sizes = {user: entry['rows'] for user, entry in manifest.items()}
+
+    # eid offset of every user, then only the partitions that can match the predicates are read
+    offsets = {}
+    offset = 0
+    sizes.update({user: len(data['start_time']) for user, data in unstored.items()})
+    for user in users:
+        if user in sizes and (user in manifest or user in unstored) and user not in offsets:
+            offsets[user] = offset
+            offset += sizes[user]
+    selected = [u for u in offsets if u in unstored or partition_matches(manifest[u], value_codes, start, end)]
+
+    stored = [c for c in columns if c in COLUMNS]
+    if consolidated is not None:
+        index, array = consolidated
+        read = lambda u: read_consolidated(array, index[u][0], index[u][1], stored, value_codes, start, end)
+    else:
+        read = lambda u: read_partition(store_directory, u, stored, value_codes, start, end)
+    parts = load_parallel(lambda u: filter_rows(unstored[u], stored, value_codes, start, end) if u in unstored else read(u),
+                          selected, timings)
+    return to_frame(selected, parts, offsets, columns, dictionary)
+
+
+# read the intervaldata.pickle of the users that are missing from the store and convert them into typed columns.
+# users without a pickle in data_directory are skipped, both are logged
+def read_unstored(data_directory, users, dictionary):
+    if len(users) == 0:
+        return {}
+    paths = {u: os.path.join(data_directory, u, 'intervaldata.pickle') for u in users} if data_directory else {}
+    existing = [u for u in users if u in paths and os.path.exists(paths[u])]
+    skipped = [u for u in users if u not in existing]
+    if len(skipped) > 0:
+        print("Users not in the interval store and without intervaldata.pickle, skipped:", ', '.join(skipped))
+    if len(existing) == 0:
+        return {}
+    print("Users not in the interval store, read from intervaldata.pickle:", ', '.join(existing))
+    frames = load_parallel(lambda u: pd.read_pickle(paths[u]), existing)
+    # the values are encoded one user at a time, encode appends unknown values to the shared dictionary
+    return {user: to_columns(df, dictionary) for user, df in zip(existing, frames)}
+
+
+# assemble the partitions into a dataframe, every column is allocated once at its final size
+# and the partitions are copied into their slice of it
+def to_frame(users, parts, offsets, columns, dictionary):
+    sizes = [len(rows) for _, rows in parts]
+    bounds = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    total = int(bounds[-1])
+
+    frame = {}
+    for name in columns:
+        if name == 'sid':
+            column = np.empty(total, dtype=object)
+        elif name == 'eid':
+            column = np.empty(total, dtype=np.int64)
+        else:
+            column = np.empty(total, dtype=COLUMNS[name])
+        for user, (data, rows), lo, hi in zip(users, parts, bounds[:-1], bounds[1:]):
+            if name == 'sid':
+                column[lo:hi] = user
+            elif name == 'eid':
+                column[lo:hi] = rows + offsets[user]
+            else:
+                column[lo:hi] = data[name]
+
+        if name in ('start_time', 'end_time'):
+            column = pd.to_datetime(column, unit='s', utc=True)
+        elif name in ('value', 'event'):
+            column = np.array(dictionary[name], dtype=object)[column] if total else column.astype(object)
+        frame[name] = column
+    return pd.DataFrame(frame, columns=columns)
+
+
+# read the intervaldata.pickle files of the selected users in parallel and concatenate them once
+def read_pickles(data_directory, users, timings=None):
+    paths = {u: os.path.join(data_directory, u, 'intervaldata.pickle') for u in users}
+    existing = [u for u in users if os.path.exists(paths[u])]
+    frames = load_parallel(lambda u: pd.read_pickle(paths[u]), existing, timings)
+    if not frames:
+        return pd.DataFrame(columns=['sid', 'start_time', 'end_time', 'value'])
+    return pd.concat(frames)
@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Manager
+from uuid import uuid4
+
+# Mining jobs that run in the background in a bounded process pool, used by the pattern routes of server.py
+# A job is submitted with a key that identifies its input (e.g. the pattern cache key of the mined sequences and the
+# mining parameters). While a job with the same key is queued or running, submitting it again returns the id of that
+# job instead of mining the same sequences twice.
+# The function of a job runs in a worker process and gets a progress function as its last argument, which it calls with
+# (done, total) to report its progress. Its result is passed to the finish function of the job, which runs in the server
+# process (e.g. to query and format the patterns and to store them in the caches of the server).
+# Every job keeps its own result, so concurrent jobs do not interfere. Only the last max_finished finished jobs are kept.
+# Every worker process has a pool of its own, so jobs that are submitted with the same affinity always run in the same
+# process (e.g. to reuse what a previous job of the same sequences left in that process), other jobs go to the worker
+# with the fewest queued and running jobs.
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+# called in the worker process, the progress of all running jobs is kept in a dict that is shared with the server
+def report_progress(progress, job_id, done, total):
+    progress[job_id] = (done, total)
+
+
+class MiningJobs:
+    """
+    Queue of mining jobs, with at most workers jobs running at the same time (the number of cores if None).
+    The pools and their processes are started when the first job is submitted.
+    """
+
+    def __init__(self, workers=None, max_finished=100):
+        self.workers = workers
+        self.max_finished = max_finished
+        # one single process pool per worker, and the number of queued and running jobs of every worker
+        self.pools = None
+        self.pending = None
+        # runs the finish functions, so the process pool can hand out its next job in the meantime
+        self.finisher = None
+        self.manager = None
+        self.progress = None
+        # job id -> job, in order of submission
+        self.jobs = OrderedDict()
+        # key -> id of the queued or running job with that key
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.pools is None:
+            self.manager = Manager()
+            self.progress = self.manager.dict()
+            workers = self.workers or os.cpu_count() or 1
+            self.pools = [ProcessPoolExecutor(max_workers=1) for _ in range(workers)]
+            self.pending = [0] * workers
+            self.finisher = ThreadPoolExecutor(max_workers=1)
+
+    def new_job(self, state):
+        job = {'id': uuid4().hex, 'state': state, 'submitted': time.time(), 'finished': None, 'progress': (0, 0),
+               'result': None, 'error': None, 'event': threading.Event()}
+        self.jobs[job['id']] = job
+        return job
+
+    def submit(self, key, func, args, finish=None, affinity=None):
+        """
+        Submits the job func(*args, progress) unless a job with the same key is queued or running.
+
+        :param key: hashable identifier of the input of the job
+        :param func: function that is run in a worker process, it and its arguments must be picklable
+        :param args: tuple of arguments of func
+        :param finish: optional function that is called in the server process with the result of func, its return value
+        is the result of the job
+        :param affinity: optional hashable, jobs with the same affinity run in the same worker process
+        :return: the id of the job
+        """
+        with self.lock:
+            if key in self.in_flight:
+                return self.in_flight[key]
+            self.start()
+            job = self.new_job(QUEUED)
+            self.in_flight[key] = job['id']
+            if affinity is None:
+                worker = self.pending.index(min(self.pending))
+            else:
+                worker = hash(affinity) % len(self.pools)
+            self.pending[worker] += 1
+            future = self.pools[worker].submit(func, *args, partial(report_progress, self.progress, job['id']))
+        future.add_done_callback(lambda future: self.finisher.submit(self.complete, key, job, finish, future, worker))
+        return job['id']
+
+    def completed(self, result):
+        """
+        Adds a job that is done already, e.g. for a result that was found in a cache
+
+        :return: the id of the job
+        """
+        with self.lock:
+            job = self.new_job(DONE)
+            job['result'] = result
+            job['finished'] = job['submitted']
+            job['event'].set()
+            self.prune()
+        return job['id']
+
+    def complete(self, key, job, finish, future, worker):
+        try:
+            result = future.result()
+            job['result'] = finish(result) if finish is not None else result
+            job['state'] = DONE
+        except Exception as e:
+            job['error'] = e
+            job['state'] = FAILED
+        with self.lock:
+            job['progress'] = self.progress.pop(job['id'], job['progress'])
+            job['finished'] = time.time()
+            del self.in_flight[key]
+            self.pending[worker] -= 1
+            self.prune()
+        job['event'].set()
+
+    def prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['state'] in (DONE, FAILED)]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[job_id]
+
+    def status(self, job_id):
+        """
+        :return: a dict with the id, state ('queued', 'running', 'done' or 'failed'), progress (fraction of the work
+        that is done), times of submission and completion and the error of the job, or None for an unknown job
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        state, (done, total) = job['state'], job['progress']
+        if state == QUEUED and job_id in self.progress:
+            # the worker reports its progress as soon as it starts mining
+            state, (done, total) = RUNNING, self.progress[job_id]
+        return {'id': job_id, 'state': state, 'progress': 1.0 if state == DONE else done / total if total > 0 else 0.0,
+                'submitted': job['submitted'], 'finished': job['finished'],
+                'error': None if job['error'] is None else repr(job['error'])}
+
+    def result(self, job_id):
+        """
+        :return: (status, result) of a job, where the result is None if the job is not done (yet)
+        """
+        status = self.status(job_id)
+        if status is None or status['state'] != DONE:
+            return status, None
+        return status, self.jobs[job_id]['result']
+
+    def wait(self, job_id, timeout=None):
+        """
+        Waits until the job is finished, and returns its result. Raises the error of a failed job
+        """
+        job = self.jobs[job_id]
+        if not job['event'].wait(timeout):
+            raise TimeoutError("mining job " + job_id + " did not finish in time")
+        if job['state'] == FAILED:
+            raise job['error']
+        return job['result']
@@ -1,4 +1,3 @@
-from functools import lru_cache
 from select import select
 from unittest import FunctionTestCase
 from flask import Flask, make_response, request, send_from_directory, jsonify
@@ -18,6 +17,13 @@ import time
 import os
 from vertTirp.ti.ti2lstis import ti_read
 from vertTirp.vertTirp import VertTIRP
+import intervalstore
+from intervalindex import IntervalIndex
+import cache
+from cache import memoize
+from miningjobs import MiningJobs
+from functools import partial
+from collections import OrderedDict
 import re
 import itertools
 from sklearn.cluster import AgglomerativeClustering
@@ -43,6 +49,28 @@ CORS(app)
 
 # select data directory: "dummydata/datasets for dummydata"
 data_directory = "data/datasets"
+# columnar interval store created with ingest.py, if it does not exist the intervaldata.pickle files are read
+store_directory = "data/store"
+
+# memory budget in bytes for cached dataframes, shared by all cached functions, and the eviction policy ('lru' or 'lfu')
+cache_budget = 2 * 1024 ** 3
+cache_policy = 'lru'
+cache.configure(cache_budget, cache_policy)
+
+# mined patterns are stored in this directory, keyed by a hash of the mined sequences and the mining parameters
+# (see pattern_cache_key), so they are reused across restarts. Increase the version to discard all stored patterns
+pattern_cache_directory = "data/pattern_cache"
+pattern_cache_version = 2
+# number of processes that mine patterns at the same time (None for the number of cores), see /submit_pattern_job
+mining_workers = 2
+# number of processes that mine the branches of the pattern tree of one job in parallel, by default the cores are
+# divided over the jobs (see VertTIRP.mine_branches)
+mining_processes = max(1, (os.cpu_count() or 1) // mining_workers)
+# number of (users, binning, filterby) contexts for which every mining worker keeps its last miner, so that a change of
+# the selected intervals only mines the patterns of the added intervals (see VertTIRP.remine), 0 to always mine anew
+remine_contexts = 2
+# the miners kept in a mining worker process, by context, least recently used first
+miners = OrderedDict()
 events = [
         'connectivity',
         'light_lux',
@@ -89,18 +117,46 @@ def get_attributes(event):
 # Backend functions     
 ############################################################
 
-# concatenate intervaldfs for each selected user and append duration column
-@lru_cache
-def get_intervaldata(set):
-    set = set.split(',')
-    final_df = pd.DataFrame(columns=['sid', 'start_time', 'end_time', 'value'])
-    for id in set:
-        path = data_directory + '/' + id + '/intervaldata.pickle'
-        isExists = os.path.exists(path)
-        if isExists:
-            df = pd.read_pickle(path)
-            final_df = pd.concat([final_df, df])
-    final_df['event'] = final_df['value'].str.split("/", expand=True)[0]
+# the functions below bring the selections in the urls into one canonical form, so that equivalent selections
+# (e.g. "3,1,2" and "1,2,3", or intervals in another order or with "-" instead of "/") share their cached results
+
+# sorted, unique user ids
+def canonical_set(set):
+    users = sorted(frozenset(set.split(',')), key=lambda user: (not user.isdigit(), int(user) if user.isdigit() else 0, user))
+    return ','.join(users)
+
+# sorted, unique interval names in the "/" encoding
+def canonical_intervals(selected_intervals):
+    return json.dumps(sorted(frozenset(x.replace("-", "/") for x in json.loads(selected_intervals))))
+
+# duration ranges per interval with float bounds, sorted on interval name
+def canonical_durs(selected_durs):
+    selecteddurs = json.loads(selected_durs)
+    return json.dumps({key.replace("-", "/"): [float(durations[0]), float(durations[1])] for key, durations in selecteddurs.items()},
+                      sort_keys=True)
+
+# hour window as two floats in [0, 24), negative hours are converted into the positive variant
+def canonical_hours(selectedhours):
+    if selectedhours == "undefined":
+        return selectedhours
+    hours = [float(hour) for hour in selectedhours.split(',')]
+    hours = [24 + hour if hour < 0 else hour for hour in hours]
+    return ','.join(repr(hour) for hour in hours)
+
+# print a summary of the per-user load times reported by the interval loader
+def print_load_timings(timings):
+    if len(timings) > 0:
+        slowest = max(timings, key=timings.get)
+        print("loaded", len(timings), "users, total user load time", round(sum(timings.values()), 3), "s, slowest user",
+              slowest, round(timings[slowest], 3), "s")
+
+# intervaldata of a single user with event, eid (row number within the user) and duration columns
+@memoize()
+def load_user_intervaldata(user):
+    if intervalstore.has_store(store_directory):
+        return intervalstore.read_intervals(store_directory, [user], data_directory=data_directory)
+    final_df = intervalstore.read_pickles(data_directory, [user])
+    final_df['event'] = final_df['value'].str.split("/").str[0]
     # final_df = final_df[final_df['event'].isin(events)]
     final_df = final_df.reset_index(drop=True)
     final_df['eid'] = final_df.index
@@ -109,6 +165,20 @@ def get_intervaldata(set):
     final_df['duration'] = (final_df['end_time'] - final_df['start_time']).astype('timedelta64[m]')
     return final_df
 
+# concatenate intervaldfs for each selected user and append duration column
+# with a consolidated store the rows are sliced from the shared memory-mapped file, so the result is not cached per worker.
+# otherwise the group is composed of the cached intervaldata of its users, so groups that share users share their loads
+def get_intervaldata(set):
+    timings = {}
+    if intervalstore.has_consolidated(store_directory):
+        final_df = intervalstore.read_intervals(store_directory, set.split(','), timings=timings,
+                                                  data_directory=data_directory)
+    else:
+        final_df = pd.concat(intervalstore.load_parallel(load_user_intervaldata, set.split(','), timings), ignore_index=True)
+        final_df['eid'] = final_df.index
+    print_load_timings(timings)
+    return final_df
+
 # filter the intervaldata on selected intervals
 def filter_intervaldata(df, selected_intervals):
     selected_intervals = json.loads(selected_intervals)
@@ -116,34 +186,59 @@ def filter_intervaldata(df, selected_intervals):
     final_df = df[df['value'].isin(filter_intervals)]
     return final_df
 
-# create daily sequences, intervals that happen on two days are split up into two separate intervals
+# intervaldata of the selected users for the selected intervals only, read directly from the consolidated store if it exists
+@memoize()
+def get_selected_intervaldata(set, selected_intervals):
+    if intervalstore.has_consolidated(store_directory):
+        filter_intervals = [x.replace("-", "/") for x in json.loads(selected_intervals)]
+        timings = {}
+        final_df = intervalstore.read_intervals(store_directory, set.split(','), values=filter_intervals, timings=timings,
+                                                  data_directory=data_directory)
+        print_load_timings(timings)
+        return final_df
+    return filter_intervaldata(get_intervaldata(set), selected_intervals)
+
+# create daily sequences, intervals that happen on multiple days are split up into one interval per day
 def bin_intervals_byday(df):
     df = df.reset_index(drop=True)
     df['participant_id'] = df['sid']
-    indices = df.index[df['end_time'].dt.strftime('%Y/%m/%d') != df['start_time'].dt.strftime('%Y/%m/%d')].tolist()
-    for i in indices:
-        first = df['start_time'][i].strftime('%Y/%m/%d')
-        second = df['end_time'][i].strftime('%Y/%m/%d')
-        row = df.iloc[i].tolist()
-        row[1] = pd.to_datetime((second + " 00:01"), utc=False)
-        df.loc[len(df)] = row
-        df.iloc[i, df.columns.get_loc('end_time')] = pd.to_datetime((first + " 23:59"), utc=False)
-
-    df['start_time'] =  pd.to_datetime(df['start_time'], utc=True)
-    df['end_time'] =  pd.to_datetime(df['end_time'], utc=True)
-    df['timebin'] = df['start_time'].dt.strftime('%Y/%m/%d')
-    df['sid'] = pd.factorize(df.timebin+df.sid)[0]
+    start_time = pd.to_datetime(df['start_time'], utc=True)
+    end_time = pd.to_datetime(df['end_time'], utc=True)
+
+    # intervals that cross midnight are split into one piece per day: the first piece ends at 23:59,
+    # the following pieces start at 00:00 and end at 23:59, except for the last one, which keeps the original end time.
+    # an interval that ends at exactly 00:00 does not get an empty piece on the day it ends
+    start_day = start_time.dt.floor('D')
+    end_day = end_time.dt.floor('D')
+    extra_days = ((end_day - start_day) // timedelta(days=1)).to_numpy()
+    extra_days = np.maximum(extra_days - (end_time == end_day).to_numpy(), 0)
+    rows = np.repeat(np.arange(len(df)), extra_days)
+    day = np.arange(len(rows)) - np.repeat(np.cumsum(extra_days) - extra_days, extra_days) + 1
+    last_minute = timedelta(hours=23, minutes=59)
+
+    # the pieces after the first are appended after the original rows, in order of interval and day
+    pieces = df.iloc[rows].reset_index(drop=True)
+    piece_start = start_day.iloc[rows].reset_index(drop=True) + pd.to_timedelta(day, unit='D')
+    pieces['start_time'] = piece_start
+    pieces['end_time'] = end_time.iloc[rows].reset_index(drop=True).where(day == extra_days[rows], piece_start + last_minute)
+    df['start_time'] = start_time
+    df['end_time'] = end_time.where(extra_days == 0, start_day + last_minute)
+    df = pd.concat([df, pieces], ignore_index=True)
+    # every piece gets the duration between its own start and end time, so that the daily sums do not count the time
+    # on the other days. The duration selection still applies to the duration of the whole interval (interval_duration)
+    df['interval_duration'] = df['duration']
+    df['duration'] = (df['end_time'] - df['start_time']).astype('timedelta64[m]')
+
+    # sequence ids per user and day, numbered in order of appearance
+    day_codes, days = pd.factorize(df['start_time'].dt.floor('D'))
+    df['timebin'] = days.strftime('%Y/%m/%d')[day_codes]
+    df['sid'] = df.groupby([day_codes, df['sid'].values], sort=False).ngroup()
     df['summeddurx'] = df.groupby(by=['sid', 'value'])['duration'].transform('sum')
 
     return df
 
-# creates sequences for selected intervals based on the selected timeframe and durations
-@lru_cache
-def bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours):
-    print("Binning")
-    rawdf = get_intervaldata(set)
-    rawdf = filter_intervaldata(rawdf, selected_intervals)
-    selecteddurs = json.loads(selected_durs)
+# convert the hour selection into the first and second selected hour as timedelta, the whole day if no hours are selected
+def parse_hours(selectedhours):
     if selectedhours != "undefined":
         selectedhours = selectedhours.split(',')
 
@@ -159,15 +254,36 @@ def bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours):
     else: 
         firsthour = timedelta(hours=0)
         secondhour = timedelta(hours=24)
-
-    # filter the dataframe on selected durations, if no duration is selected for a selected interval, include all durations
-    for key in selecteddurs:
-        interval = key.replace("-", "/")
-        durations = selecteddurs[key]
-        intervaldf = rawdf.loc[rawdf['value'] == interval]
-        intervaldf = intervaldf.loc[(float(durations[0]) <= intervaldf['duration'].astype(float)) & (intervaldf['duration'].astype(float) <= float(durations[1]))]
-        rawdf = rawdf.loc[rawdf['value'] != interval]
-        rawdf = pd.concat([rawdf, intervaldf])
+    return firsthour, secondhour
+
+# keep the intervals within the selected duration range of their interval type, if no duration is selected for a selected interval, include all durations.
+# all ranges are applied in one mask, using the lower and upper bound of the interval type of every row.
+# column is the duration that is compared with the ranges
+def filter_durations(df, selected_durs, column='duration'):
+    selecteddurs = {key.replace("-", "/"): durations for key, durations in json.loads(selected_durs).items()}
+    lower = df['value'].map({interval: float(durations[0]) for interval, durations in selecteddurs.items()})
+    upper = df['value'].map({interval: float(durations[1]) for interval, durations in selecteddurs.items()})
+    duration = df[column].astype(float)
+    keep = (lower.isna() | ((lower <= duration) & (duration <= upper))).to_numpy()
+    # the intervals with a selected duration range follow the other intervals, per interval in order of selection
+    position = df['value'].map({interval: i + 1 for i, interval in enumerate(selecteddurs)}).fillna(0).to_numpy()
+    return df.loc[keep].iloc[np.argsort(position[keep], kind='stable')]
+
+# intervaldata of the selected intervals within the selected durations
+def get_duration_filtered(set, selected_intervals, selected_durs):
+    if len(json.loads(selected_durs)) == 0:
+        return get_selected_intervaldata(set, selected_intervals)
+    return filter_selected_durations(set, selected_intervals, selected_durs)
+
+@memoize()
+def filter_selected_durations(set, selected_intervals, selected_durs):
+    return filter_durations(get_selected_intervaldata(set, selected_intervals), selected_durs)
+
+# intervals of the selected intervals and durations that fall within the selected timeframe, cut off at the selected hours
+@memoize()
+def get_hour_window(set, selected_intervals, selected_durs, selectedhours):
+    rawdf = get_duration_filtered(set, selected_intervals, selected_durs)
+    firsthour, secondhour = parse_hours(selectedhours)
 
     duration = secondhour - firsthour
     if duration.days != 0:
@@ -213,38 +329,33 @@ def bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours):
         fulloverlap['end_time'] = fulloverlap['end_time'].dt.normalize() + secondhour
     filtereddf = pd.concat([leftoverlap, rightoverlap, middle, fulloverlap]).drop_duplicates()
     filtereddf['duration'] = (filtereddf['end_time'] - filtereddf['start_time']).astype('timedelta64[m]')
+    return filtereddf
 
+# creates sequences for selected intervals based on the selected timeframe and durations
+@memoize()
+def bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours):
+    print("Binning")
+    filtereddf = get_hour_window(set, selected_intervals, selected_durs, selectedhours)
+    firsthour, secondhour = parse_hours(selectedhours)
+    duration = secondhour - firsthour
 
     # if the selected timeframe covers two consecutive days, create sequence ids based on timeframe and user id
     if duration.days != 0:
-        duration = duration - timedelta(days=duration.days)
         filtereddf = filtereddf.sort_values(['sid', 'start_time']).reset_index(drop=True)
-        binned_df = pd.DataFrame(columns=['sid', 'start_time', 'end_time', 'value', 'duration', 'timebin'])
-        ids = filtereddf['sid'].unique()
-        id = 0
-        for i in range(len(ids)):
-            id_df = filtereddf.loc[filtereddf['sid'] == ids[i]]
-            while len(id_df) > 0:
-                date1 = id_df.iloc[0]['start_time'].strftime('%Y/%m/%d')
-                date2 = id_df.iloc[0]['end_time'].strftime('%Y/%m/%d')
-                if date1 == date2:
-                    if (datetime.min + firsthour).time() > id_df.iloc[0]['start_time'].time():
-                        start = id_df.iloc[0]['start_time'].normalize() - timedelta(days=1) + firsthour
-                    else:
-                        start = id_df.iloc[0]['start_time'].normalize() + firsthour
-                else: 
-                    start = id_df.iloc[0]['start_time'].normalize() + firsthour
-                end = start + duration
-                bin_df = id_df.loc[(start <= id_df['start_time']) & (id_df['start_time'] <= end)]
-                id_df = id_df.drop(bin_df.index)
-                bin_df['part'] = bin_df['sid']
-                bin_df['sid'] = id
-                binned_df = pd.concat([binned_df, bin_df])
-                id += 1
+        # every interval belongs to the timeframe that starts at the last occurrence of the first selected hour
+        # before its start time, sequences are numbered per user and timeframe in order of time
+        window_start = (filtereddf['start_time'] - firsthour).dt.floor('D') + firsthour
+        binned_df = filtereddf
+        binned_df['part'] = binned_df['sid']
+        binned_df['sid'] = binned_df.groupby([binned_df['sid'], window_start], sort=True).ngroup()
+        binned_df['timebin'] = np.nan
+        binned_df = binned_df[['sid', 'start_time', 'end_time', 'value', 'duration', 'timebin']
+                              + [column for column in binned_df.columns if column not in ('sid', 'start_time', 'end_time', 'value', 'duration', 'timebin')]]
         binned_df = binned_df.sort_values('value')
     # if selected timeframe only includes times on the same day, create sequence ids based on date and user id
     else:
-        binned_df = filtereddf
+        binned_df = filtereddf.copy()
+        binned_df['part'] = binned_df['sid']
         binned_df['timebin'] = binned_df['start_time'].dt.strftime('%Y/%m/%d')
         binned_df['sid'] = pd.factorize(binned_df.timebin+binned_df.sid)[0]
         binned_df = binned_df.drop(columns=['timebin'])
@@ -252,8 +363,41 @@ def bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours):
 
 # mine patterns according to the VERTIRP algorithm: https://doi.org/10.1016/j.eswa.2020.114276 
 # (Mordvanyuk, N., López, B., & Bifet, A. (2021). vertTIRP: Robust and efficient vertical frequent time interval-related pattern mining. Expert Systems with Applications, 168, 114276.)
-def mine_seqs(df):
+# VertTIRP parameters used by mine_seqs
+mining_params = dict(
+    time_mode = 1,  # timestamp_mode: if True we convert the date to timestamp (long number), otherwise to datetime.
+    min_sup_rel = 0.05, # vertical support
+    eps = 0,  # epsilon value in seconds, that allows uncertainty and avoids crisp borders in relations
+    dummy_calc = False,  # whether to execute relations without a pairing strategies
+    trans = True,  # whether to use transitivity properties when assign a relation
+    min_gap = 0, # minimum gap in seconds that is the gap between before consecutive elements
+    # change this to a lower number if processing takes too long..
+    max_gap = 30, # maximum gap in seconds that is the gap between before consecutive elements
+    min_duration = 1, # each event interval should have a duration of at least min_duration seconds
+    max_duration = 60*60*10,  # each tirp should have a duration of at most min_duration seconds
+    # ps is a string that represents relations sorted and grouped following a pairing strategy
+    # If None, a default common strategies will be used that is:
+    # "bmocfse" for eps = 0, and "bselfmoc" for eps>0
+    ps = "mocfbes",
+    # if not -1, only the top_k patterns with the highest vertical support are mined, counting the patterns of at least
+    # min_length intervals (add min_length = 2 to skip the single intervals). Note that the view ranks the patterns
+    # with a 'c' or 's' relation by their queried support (see rank_patterns), so its top 10 may differ
+    top_k = -1,
+)
+avoid_same_var_states = False
+# mine with the columnar (NumPy) vertical database instead of the object one, it finds the same patterns and is faster
+# on large selections, but slower on small ones (see vertTirp_columnar.py)
+columnar_mining = False
+# the pattern view only shows patterns of two intervals (see format_patterns), which are mined with one sweep over the
+# sequences (VertTIRP.mine_pairs) instead of the search for patterns of any length. Set to False to also mine (and keep
+# the occurrences of) longer patterns
+pair_mining = True
+
+# progress (optional) is called with (done, total) while mining, see VertTIRP.mine_patterns
+def mine_seqs(df, context=None, progress=None):
     df = df.reset_index(drop=True)
+    # the sequences are mined by name (see select_pattern_sequences), so that a miner of the same context can match them
+    df['sid'] = df['sequence']
     
     # ensure that start and endtime are in string format
     df['start_time'] =  pd.to_datetime(df['start_time'], utc=False)
@@ -262,111 +406,144 @@ def mine_seqs(df):
     df = df.sort_values(by=['start_time', 'end_time']).reset_index(drop=True)
     df['start_time'] = df['start_time'].dt.strftime('%Y/%m/%d %H:%M:%S')
     df['end_time'] = df['end_time'].dt.strftime('%Y/%m/%d %H:%M:%S')
+    eids = df[['sid', 'value', 'start_time', 'end_time', 'eid']]
     df = df.drop(columns='eid')
 
-    # parameters explanation
-    timestamp_mode = 1  # timestamp_mode: if True we convert the date to timestamp (long number), otherwise to datetime.
-    ver_sup = 0.05 # vertical support
-    eps = 0  # epsilon value in seconds, that allows uncertainty and avoids crisp borders in relations
-    dummy = False  # whether to execute relations without a pairing strategies
-    trans = True  # whether to use transitivity properties when assign a relation
-    result_file_name = "my_result_file.csv"  # an output file 
-
-    avoid_same_var_states = False
-    ming = 0 # minimum gap in seconds that is the gap between before consecutive elements
-    # change this to a lower number if processing takes too long..
-    maxg = 30 # maximum gap in seconds that is the gap between before consecutive elements
-    mind = 1 # each event interval should have a duration of at least min_duration seconds
-    maxd = 60*60*10  # each tirp should have a duration of at most min_duration seconds
-    # ps is a string that represents relations sorted and grouped following a pairing strategy
-    # If None, a default common strategies will be used that is:
-    # "bmocfse" for eps = 0, and "bselfmoc" for eps>0
-    ps = "mocfbes"
-
     # reads time intervals from csv and transforms them to the LSTIs representation
     list_of_ti_users, list_of_users, ti_count = ti_read(df)
 
-    # initialize the algorithm with parameters
-    co = VertTIRP(time_mode=timestamp_mode, out_file=result_file_name, min_sup_rel=ver_sup,
-                eps=eps, min_gap=ming, max_gap=maxg, min_duration=mind, max_duration=maxd, dummy_calc=dummy,
-                ps=ps, trans=trans)
-    # constructs a vertical dataset representation and mines the patterns
-    # mine_patterns corresponds to the vertTIRP algorithm from the article
-    tirp_count = co.mine_patterns(list_of_ti_users, list_of_users, avoid_same_var_states)
+    co = miners.pop(context, None)
+    if co is not None:
+        # the patterns of the last selection of this context, only the changed intervals are mined
+        tirp_count = co.remine(list_of_ti_users, list_of_users, progress, mining_processes)
+    else:
+        # initialize the algorithm with parameters
+        co = VertTIRP(columnar=columnar_mining, **mining_params)
+        # constructs a vertical dataset representation and mines the patterns
+        # mine_patterns corresponds to the vertTIRP algorithm from the article
+        if pair_mining:
+            tirp_count = co.mine_pairs(list_of_ti_users, list_of_users, avoid_same_var_states, progress)
+        else:
+            tirp_count = co.mine_patterns(list_of_ti_users, list_of_users, avoid_same_var_states, progress, mining_processes)
+    if context is not None and remine_contexts > 0:
+        miners[context] = co
+        while len(miners) > remine_contexts:
+            miners.popitem(last=False)
     print(tirp_count)
-    # prints the tirps in the deep first search fashion if dfs=True,
-    # and in breast first search if dfs=False
-    co.print_patterns(dfs=True)
-
-
-# retrieve pandas dataframe with pattern relative times and support metrics from VERTIRP csv file ("my_result_file.csv")
-def format_patterns():
-    ruledf = pd.DataFrame(columns=('pattern_id', 'relations', 'interval', 'times', 'support')).astype(object)
-    with open("my_result_file.csv") as f:
-        pattern_id = 0
-        lines = f.readlines()
-        i = 0
-        # loop over the lines in the csv file
-        while i <= len(lines) - 1:
-            # retrieve line1, which contains the event-interval names for a pattern
-            line1 = lines[i].strip()
-            line1 = eval(line1)
-            # filter patterns with more than one event
-            if len(line1) > 1:
-                count = 1
-                for k, line2 in enumerate(lines[i+1:]):
-                    if "#" in line2:
-                        # retrieve line2, which contains the pattern type, the vertical and horizontal support and the mean duration
-                        # note: line1 can be accompanied by multiple line2's
-                        relations =  re.split("#", line2)
-                        symseq = relations[0].strip()
-                        # Change this to a higher number if you want to mine patterns with more than two intervals!
-                        if len(symseq) < 3:
-                            supp = relations[1].split("ver:")[1].strip()
-                            relations = relations[0].strip()
-                            timelist = pd.DataFrame(columns=('pattern_id', 'relations', 'interval', 'times', 'support')).astype(object)
-
-                        # loop over the length of the relation types 
-                            for j in range(len(line1)):
-                                element = line1[j]
-                                nr_relations = len(line1[j+1:])
-                                elementlist = re.split('value_', element)
-                                interval = elementlist[1]
-                                # transformations from relation type to relative times, will be used to visualize the intervals as rectangles on a relative timeline
-                                # the first element gets timestamps 0 and 1
-                                if j == 0:
-                                    times = [0, 1]
-                                    timelist.loc[len(timelist)] = [pattern_id, symseq, interval, times, supp]
-                                for l in range(nr_relations):
-                                    interval = re.split('value_', line1[j + l + 1])[1]
-                                    relation = relations[l] 
-                                    if relation == 'b':
-                                        times = [timelist.iloc[j]['times'][0] + 2, timelist.iloc[j ]['times'][1] + 2]
-                                    elif relation == 'm':
-                                        times = [timelist.iloc[j]['times'][1], timelist.iloc[j]['times'][1] + 1]
-                                    elif relation == 'c':
-                                        times = [timelist.iloc[j]['times'][0] + 1/4, timelist.iloc[j]['times'][1] - 1/4]
-                                    elif relation == 'o':
-                                        times = [timelist.iloc[j]['times'][1] - 1/4, timelist.iloc[j]['times'][1] + 3/4]
-                                    elif relation == 'f':
-                                        times = [timelist.iloc[j]['times'][0] + 1/4, timelist.iloc[j]['times'][1]]
-                                    elif relation == 'e':
-                                        times = [timelist.iloc[j]['times'][0], timelist.iloc[j]['times'][1]]
-                                    elif relation == 's':
-                                        timelist.loc[j, 'times'] = [[timelist.iloc[j]['times'][0]], [timelist.iloc[j]['times'][0] + 1/2]]
-                                        times = [timelist.iloc[j]['times'][0], timelist.iloc[j]['times'][0] + 1]
-                                    timelist.loc[l + j + 1] = [pattern_id, symseq, interval, times, supp]
-                                relations = relations[nr_relations:]
-                            ruledf = pd.concat([ruledf, timelist])
-                            pattern_id += 1
-                        count +=1
-                    else:
-                        i += count
-                        break  
-                if k == len(lines[i+1:]) -1:
-                    i = len(lines) + 1
-            else:
-                i += 2  
+    # the tirps in deep first search order, and their instances
+    return co.get_results(), pattern_occurrences(co, eids)
+
+# map the instances that VertTIRP found for every pattern back to the eids of their intervals (eids: sid, value,
+# start_time and end_time as passed to ti_read, and eid). Returns a dict (intervals, relations) -> {'support': vertical
+# support, 'sequences': number of sequences with an instance, 'eids': eids of all instances}
+def pattern_occurrences(co, eids):
+    # ti_read converts the times into timestamps and prefixes the values with the column name
+    timestamps = {time: datetime.strptime(time, '%Y/%m/%d %H:%M:%S').timestamp()
+                  for time in pd.unique(eids[['start_time', 'end_time']].values.ravel())}
+    lookup = {}
+    for sid, value, start, end, eid in eids.itertuples(index=False):
+        lookup.setdefault((sid, 'value_' + value, timestamps[start], timestamps[end]), []).append(eid)
+
+    occurrences = {}
+    for symbols, rel, sidlist, tirp_stat in co.get_occurrences():
+        pattern_eids = {}
+        for sid, tirp in tirp_stat.get_instances():
+            for ti in tirp.ti:
+                pattern_eids.update(dict.fromkeys(lookup.get((sid, ti.sym, ti.start, ti.end), [])))
+        intervals = tuple(re.split('value_', symbol)[1] for symbol in symbols)
+        occurrences[(intervals, rel.strip())] = {'support': sidlist.get_ver_support(tirp_stat),
+                                                 'sequences': tirp_stat.sum_ver_supp,
+                                                 'eids': [int(eid) for eid in pattern_eids]}
+    return occurrences
+
+# occurrences of the patterns per selection and filterby, kept in the shared cache (bounded by its budget) and stored
+# next to the patterns in the pattern cache directory, so they are the same after a pattern cache hit or a restart
+cache.register('pattern_occurrences')
+
+def get_pattern_occurrences(set, selected_intervals, selected_durs, selectedhours, filterby='all'):
+    selection = (set, selected_intervals, selected_durs, selectedhours, filterby)
+    found, occurrences = cache.get('pattern_occurrences', selection)
+    if found:
+        return occurrences
+    binned_df = select_pattern_sequences(set, selected_intervals, selected_durs, selectedhours, filterby)
+    if len(binned_df) <= 1:
+        return None
+    occurrences = read_cached_occurrences(pattern_cache_key(binned_df, filterby))
+    if occurrences is not None:
+        cache.put('pattern_occurrences', selection, occurrences)
+    return occurrences
+
+
+# key of the pattern cache: md5 of the sequences that are mined (and queried) together with the mining parameters,
+# so a changed selection, changed data or changed parameters result in another key
+def pattern_cache_key(df, filterby):
+    digest = md5()
+    columns = df[['sid', 'start_time', 'end_time', 'value']]
+    digest.update(pd.util.hash_pandas_object(columns, index=False).values.tobytes())
+    digest.update(json.dumps([pattern_cache_version, filterby, mining_params, avoid_same_var_states], sort_keys=True).encode())
+    return digest.hexdigest()
+
+# mined and formatted patterns (records as returned by get_pattern_data) from the pattern cache, None if not cached
+def read_cached_patterns(key):
+    path = os.path.join(pattern_cache_directory, key + ".json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+# occurrences (see pattern_occurrences) of the mined patterns from the pattern cache, None if not cached
+def read_cached_occurrences(key):
+    path = os.path.join(pattern_cache_directory, key + ".occurrences.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return {(tuple(record.pop('intervals')), record.pop('relations')): record for record in json.load(f)}
+
+def write_cached_occurrences(key, occurrences):
+    os.makedirs(pattern_cache_directory, exist_ok=True)
+    path = os.path.join(pattern_cache_directory, key + ".occurrences.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump([dict(occurrence, intervals=list(intervals), relations=relations)
+                   for (intervals, relations), occurrence in occurrences.items()], f)
+    os.replace(path + ".tmp", path)
+
+def write_cached_patterns(key, records):
+    os.makedirs(pattern_cache_directory, exist_ok=True)
+    path = os.path.join(pattern_cache_directory, key + ".json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(records, f)
+    os.replace(path + ".tmp", path)
+
+# relative times of the second interval of a 2-interval pattern, per relation with the first interval (which gets times 0 and 1).
+# these are used to visualize the intervals as rectangles on a relative timeline
+relation_times = {
+    'b': [2, 3],
+    'm': [1, 2],
+    'c': [1/4, 3/4],
+    'o': [3/4, 7/4],
+    'f': [1/4, 1],
+    'e': [0, 1],
+    's': [0, 1],
+}
+
+# retrieve pandas dataframe with pattern relative times and support metrics from the results of VertTIRP (see VertTIRP.get_results)
+def format_patterns(results):
+    rows = []
+    index = []
+    pattern_id = 0
+    for symbols, relations, supp in zip(results['symbols'], results['relations'], results['ver_support']):
+        # Change this to a higher number if you want to mine patterns with more than two intervals!
+        if len(symbols) > 1 and len(relations) < 3:
+            intervals = [re.split('value_', symbol)[1] for symbol in symbols]
+            relation = relations[0]
+            # the first element gets timestamps 0 and 1, with a 'starts' relation the first element is drawn half as long
+            first_times = [0, 1/2] if relation == 's' else [0, 1]
+            # the support is passed on as text, like it was read from the csv output of VertTIRP
+            rows += [[pattern_id, relations, intervals[0], first_times, str(supp)],
+                     [pattern_id, relations, intervals[1], list(relation_times.get(relation, [0, 1])), str(supp)]]
+            index += [0, 1]
+            pattern_id += 1
+    ruledf = pd.DataFrame(rows, index=index, columns=('pattern_id', 'relations', 'interval', 'times', 'support'), dtype=object)
     ruledf['id'] = ruledf.index
     return ruledf
 
@@ -474,7 +651,7 @@ def radial_cluster(data):
     return ordereddata
 
 # create dataframe for radial view
-@lru_cache
+@memoize()
 def get_radial_df(set, selected_intervals):
     interval_df = get_cached_binned(set, selected_intervals)
     radial_df = radial_cluster(interval_df)
@@ -486,156 +663,186 @@ def get_radial_df(set, selected_intervals):
 
 # function to query a pattern (eventlist + relations) from the selected data (data)
 def query(data, eventlist, relations):
-    maxg = 10
-    highlight = []
-    total = data['sid'].nunique()
-    ratio = 0
-    for sid in data['sid'].unique():
-        id_df = data.loc[data['sid'] == sid]
-        element_ids = {}
-        for k in range(len(eventlist)):
-            element_ids[k] = []
-        sorted = id_df.sort_values(by='start_time').reset_index(drop=True)
-        sorted['start_time'] = pd.to_datetime(sorted['start_time'], errors='coerce')
-        total_relations = relations
-        break_out_flag = False
-        for event_int in range(len(eventlist)):
-            nr_relations = len(eventlist[event_int + 1:])
-            first_element = eventlist[event_int]
-            for rel_int in range(nr_relations):
-                second_element = eventlist[event_int + rel_int + 1]
-                first_ids = []
-                second_ids = []
-
-                if total_relations[rel_int] == 'b':
-                    i = 0
-                    while i <= len(sorted) - 2:
-                        if sorted.iloc[i]['value'] == first_element:
-                            end_time = sorted.iloc[i]['end_time']
-                            second_id = sorted.loc[(sorted['value'] == second_element) & (sorted['start_time'] > end_time) & ((0 < (sorted['start_time'] - end_time).dt.total_seconds()) & ( (sorted['start_time'] - end_time).dt.total_seconds()  < maxg))]['eid'].tolist()  
-                            if len(second_id) > 0:
-                                first_id = sorted.iloc[i]['eid']
-                                first_ids.append(first_id)
-                                second_ids.append(second_id)
-                        i += 1
-
-                elif total_relations[rel_int] == 'm':
-                        first = sorted.loc[sorted['value'] == first_element]['end_time'].dt.strftime('%Y/%m/%d %H:%M')
-                        second = sorted.loc[sorted['value'] == second_element]['start_time'].dt.strftime('%Y/%m/%d %H:%M')
-                        times = set(first).intersection(second)
-                        first_ids = sorted.loc[(sorted['value'] == first_element) & sorted['end_time'].dt.strftime('%Y/%m/%d %H:%M').isin(times)]['eid'].tolist()
-                        second_ids = sorted.loc[(sorted['value'] == second_element) & sorted['start_time'].dt.strftime('%Y/%m/%d %H:%M').isin(times)]['eid'].tolist()
-                
-                elif total_relations[rel_int] == 'c':
-                    i = 0
-                    while i <= len(sorted) - 2:
-                        if sorted.iloc[i]['value'] == first_element:
-                            start_time = sorted.iloc[i]['start_time']
-                            end_time = sorted.iloc[i]['end_time']
-                            second_id = sorted.loc[(sorted['value'] == second_element) & (sorted['start_time'] > start_time) & (sorted['start_time'] < end_time) & (sorted['end_time'] < end_time)]['eid'].tolist()
-                            if len(second_id) > 0:
-                                first_id = sorted.iloc[i]['eid']
-                                first_ids.append(first_id)
-                                second_ids.append(second_id)
-                        i += 1
-
-                elif total_relations[rel_int] == 'o':
-                    i = 0
-                    while i <= len(sorted) - 2:
-                        if sorted.iloc[i]['value'] == first_element:
-                            start_time = sorted.iloc[i]['start_time']
-                            end_time = sorted.iloc[i]['end_time']
-                            second_id = sorted.loc[(sorted['value'] == second_element) & (sorted['start_time'] > start_time) & (sorted['start_time'] < end_time) & (sorted['end_time'] > end_time)]['eid'].tolist()
-                            if len(second_id) > 0:
-                                first_id = sorted.iloc[i]['eid']
-                                first_ids.append(first_id)
-                                second_ids.append(second_id)
-                        i += 1
-
-                elif total_relations[rel_int] == 'f':
-                    i = 0
-                    while i <= len(sorted) - 2:
-                        if sorted.iloc[i]['value'] == first_element:
-                            start_time = sorted.iloc[i]['start_time']
-                            end_time = sorted.iloc[i]['end_time']
-                            second_id = sorted.loc[(sorted['value'] == second_element) & (sorted['start_time'] > start_time) & (sorted['start_time'] < end_time) & (sorted['end_time'].dt.strftime('%Y/%m/%d %H:%M') == end_time.strftime('%Y/%m/%d %H:%M'))]['eid'].tolist()
-                            if len(second_id) > 0:
-                                first_id = sorted.iloc[i]['eid']
-                                first_ids.append(first_id)
-                                second_ids.append(second_id)
-                        i += 1
-
-
-                elif total_relations[rel_int] == 'e':
-                    first = sorted.loc[sorted['value'] == first_element]
-                    first['index'] = first.index
-                    second = sorted.loc[sorted['value'] == second_element]
-                    second['index'] = second.index
-                    result = pd.merge(first, second, how='inner', on=['start_time', 'end_time'] )
-                    if len(result) > 0:
-                        ind_list = result[['index_x', 'index_y']].values.tolist()
-                        indices = [item for sublist in ind_list for item in sublist]
-                        index = sorted.iloc[indices]
-                        first_ids = index.loc[index['value'] == first_element]['eid'].values.tolist()
-                        second_ids = index.loc[index['value'] == second_element]['eid'].values.tolist()
-                        
-
-                elif total_relations[rel_int] == 's':
-                    i = 0
-                    while i <= len(sorted) - 2:
-                        if sorted.iloc[i]['value'] == first_element:
-                            start_time = sorted.iloc[i]['start_time']
-                            end_time = sorted.iloc[i]['end_time']
-                            second_id = sorted.loc[(sorted['value'] == second_element) & (sorted['start_time'].dt.strftime('%Y/%m/%d %H:%M') == start_time.strftime('%Y/%m/%d %H:%M')) & (sorted['end_time'] > end_time)]['eid'].tolist()
-                            if len(second_id) > 0:
-                                first_id = sorted.iloc[i]['eid']
-                                first_ids.append(first_id)
-                                second_ids.append(second_id)
-                        i += 1
-                
-                # flatten list if necessary
-                if any(isinstance(i, list) for i in first_ids):
-                    first_ids = [item for sublist in first_ids for item in sublist]
-                if any(isinstance(i, list) for i in second_ids):
-                    second_ids = [item for sublist in second_ids for item in sublist]
-
-                if (len(first_ids) == 0) | (len(second_ids) == 0):
-                    break_out_flag = True
-                    break
-                if len(element_ids[event_int])!= 0:
-                    first_ids = list(set(first_ids).intersection(element_ids[event_int]))
-                if len(element_ids[event_int + rel_int + 1])!= 0:
-                    second_ids = list(set(second_ids).intersection(element_ids[event_int + rel_int + 1]))
-
-                element_ids[event_int] = first_ids
-                element_ids[event_int + rel_int + 1] = second_ids  
-            total_relations = total_relations[nr_relations:]
-
-            if break_out_flag:
+    return query_patterns(data, [(eventlist, relations)])[0]
+
+# query many patterns (list of (eventlist, relations)) in one pass over the sequences of the selected data (data, or its
+# IntervalIndex). Every sequence is indexed once, and the pairs of a relation between two elements are looked up once per
+# sequence for all patterns that contain them. Returns a (highlight ids, support) tuple per pattern
+def query_patterns(data, patterns):
+    # the same maximum gap as the miner, so queried patterns have the instances and support of the mined ones
+    maxg = mining_params['max_gap']
+    index = data if isinstance(data, IntervalIndex) else IntervalIndex(data)
+    highlights = [[] for _ in patterns]
+    ratios = [0] * len(patterns)
+    total = len(index.sequences)
+    for sequence in index.sequences:
+        relation_ids = {}
+        for p, (eventlist, relations) in enumerate(patterns):
+            highlight_ids = query_sequence(sequence, eventlist, relations, maxg, relation_ids)
+            # update ratio to compute support
+            if len(highlight_ids) > 0:
+                ratios[p] += 1
+            highlights[p].append(highlight_ids)
+    results = []
+    for highlight, ratio in zip(highlights, ratios):
+        highlight = [int(item) for sublist in highlight for item in sublist]
+        results.append((highlight, ratio / total))
+    return results
+
+# ids of the intervals of one sequence (SequenceIndex) that take part in the pattern, empty if the pattern does not occur.
+# relation_ids caches the relation lookups of the sequence by (first element, second element, relation)
+def query_sequence(sequence, eventlist, relations, maxg, relation_ids):
+    element_ids = {}
+    for k in range(len(eventlist)):
+        element_ids[k] = []
+    total_relations = relations
+    break_out_flag = False
+    for event_int in range(len(eventlist)):
+        nr_relations = len(eventlist[event_int + 1:])
+        first_element = eventlist[event_int]
+        for rel_int in range(nr_relations):
+            second_element = eventlist[event_int + rel_int + 1]
+            # look up the intervals of both elements that are in the relation in the interval index of the sequence
+            key = (first_element, second_element, total_relations[rel_int])
+            if key not in relation_ids:
+                relation_ids[key] = sequence.relation_ids(first_element, second_element, total_relations[rel_int], maxg)
+            first_ids, second_ids = relation_ids[key]
+
+            if (len(first_ids) == 0) | (len(second_ids) == 0):
+                break_out_flag = True
                 break
+            if len(element_ids[event_int])!= 0:
+                first_ids = list(set(first_ids).intersection(element_ids[event_int]))
+            if len(element_ids[event_int + rel_int + 1])!= 0:
+                second_ids = list(set(second_ids).intersection(element_ids[event_int + rel_int + 1]))
 
-        highlight_ids = list(element_ids.values())
-        if any(isinstance(i, list) for i in highlight_ids):
-            highlight_ids = [item for sublist in highlight_ids for item in sublist]
-        # update ratio to compute support 
-        if len(highlight_ids) > 0:
-            ratio +=1
-        highlight.append(highlight_ids)
-    if any(isinstance(i, list) for i in highlight):
-        highlight = [item for sublist in highlight for item in sublist]
-    highlight = [int(item) for item in highlight]
-    support = ratio / total
-    return highlight, support
+            element_ids[event_int] = first_ids
+            element_ids[event_int + rel_int + 1] = second_ids  
+        total_relations = total_relations[nr_relations:]
+
+        if break_out_flag:
+            break
+
+    return [item for sublist in element_ids.values() for item in sublist]
 
 # get cached data, bin by day, filter if necessary
-@lru_cache
+@memoize()
 def get_cached_binned(set, filter=False):
-    fulldf = get_intervaldata(set)
     if filter:
-        fulldf = filter_intervaldata(fulldf, filter)
+        fulldf = get_selected_intervaldata(set, filter)
+    else:
+        fulldf = get_intervaldata(set)
     binned_df = bin_intervals_byday(fulldf)
     return binned_df
 
+# daily sequences of the selected intervals within the selected durations
+@memoize()
+def get_binned_durations(set, selected_intervals, selected_durs):
+    return filter_durations(get_cached_binned(set, selected_intervals), selected_durs, column='interval_duration')
+
+# the routes select their sequences in the same stages: load the intervaldata of the users (get_intervaldata), keep the
+# selected intervals (get_selected_intervaldata), keep the selected durations (get_duration_filtered), cut off the
+# intervals at the selected hours (get_hour_window) and bin them into sequences per timeframe (bin_intervals_custom).
+# without selected hours, the selected intervals are binned per day (get_cached_binned) before the durations are filtered.
+# every stage is cached on the (canonical) selection it depends on, so routes share the stages they have in common
+def select_sequences(set, selected_intervals, selected_durs, selectedhours):
+    if selectedhours == "undefined":
+        return get_binned_durations(set, selected_intervals, selected_durs)
+    return bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours)
+
+# interval index of the selected sequences, used to query patterns
+@memoize()
+def get_interval_index(set, selected_intervals, selected_durs, selectedhours):
+    return IntervalIndex(select_sequences(set, selected_intervals, selected_durs, selectedhours))
+
+# mining jobs of get_pattern_data and /submit_pattern_job, every job mines in its own process and keeps its own result
+mining_jobs = MiningJobs(mining_workers)
+
+# query the mined patterns (results of mine_seqs) to find the accurate support and retrieve the patterns with highest
+# vertical support. Runs in the server process when a mining job is done, and stores the patterns in the pattern cache
+def rank_patterns(binned_df, key, selection, mined):
+    results, occurrences = mined
+    cache.put('pattern_occurrences', selection, occurrences)
+    write_cached_occurrences(key, occurrences)
+    # format the resulting patterns into a pandas dataframe
+    ruledf = format_patterns(results)
+
+    # query the patterns to find the accurate support
+    print("ruledf", ruledf)
+    pattern_dfs = [ruledf.loc[ruledf['pattern_id'] == pattern_id] for pattern_id in ruledf['pattern_id'].unique()]
+    queried = [pattern_df for pattern_df in pattern_dfs
+               if ('c' in pattern_df.iloc[0]['relations']) or ('s' in pattern_df.iloc[0]['relations'])]
+    results = query_patterns(binned_df, [(pattern_df['interval'].tolist(), pattern_df.iloc[0]['relations']) for pattern_df in queried])
+    for pattern_df, (highlight, support) in zip(queried, results):
+        print("support", pattern_df.iloc[0]['relations'], highlight, support)
+        # pattern_df['highlight'] = [highlight] * len(pattern_df)
+        pattern_df['support'] = [support] * len(pattern_df)
+    finalrules = pd.concat([pd.DataFrame()] + pattern_dfs)
+    print("finalrules", finalrules)
+
+    # retrieve the five patterns with highest vertical support
+    if len(finalrules) > 0: 
+        finalrules['support'] = finalrules['support'].astype(float)
+        supp = finalrules.groupby(by=['pattern_id'])['support'].first().sort_values(ascending=False)
+        order = supp.index.tolist()
+        label_dict = {}
+        for i in range(len(order)):
+            label_dict[order[i]] = i
+        finalrules = finalrules.replace({"pattern_id" : label_dict})
+        finalrules = finalrules.sort_values(['pattern_id']).reset_index(drop=True)
+        finalrules = finalrules.loc[finalrules['pattern_id'] <= 10]
+    print("finalrules", finalrules)
+    finalrules = json.loads(finalrules.to_json(orient='records'))
+    write_cached_patterns(key, finalrules)
+    return finalrules
+
+# the sequences of which the patterns are mined: the selected sequences, optionally only the ones that contain the
+# interval filterby ('all' for all sequences)
+def select_pattern_sequences(set, selected_intervals, selected_durs, selectedhours, filterby):
+    # add sequence ids based on selected timeframe
+    binned_df = select_sequences(set, selected_intervals, selected_durs, selectedhours)
+    if len(binned_df) <= 1:
+        return binned_df
+
+    # filter df by interval of interest (optional)
+    if filterby != 'all':
+        for sequence in binned_df['sid'].unique():
+            seqdf = binned_df.loc[binned_df['sid'] == sequence]
+            if filterby not in seqdf['value'].unique():
+                binned_df = binned_df.loc[binned_df['sid'] != sequence]
+
+    # name every sequence after its user and the day on which its timeframe starts. Unlike the sids, which are numbered
+    # per selection, the names stay the same when the selected intervals change, see VertTIRP.remine
+    firsthour, secondhour = parse_hours(selectedhours)
+    user = binned_df['participant_id'] if selectedhours == "undefined" else binned_df['part']
+    day = (binned_df['start_time'] - firsthour).dt.strftime('%Y/%m/%d')
+    return binned_df.assign(sequence=user.astype(str) + '/' + day)
+
+# submit a job that mines the patterns of the selected sequences, optionally only of the sequences that contain the
+# interval filterby. Returns the id of the job. Patterns that are in the pattern cache are returned by a job that is done
+# already, and a selection of which the same sequences are being mined gets the id of the job that mines them
+def submit_pattern_job(set, selected_intervals, selected_durs, selectedhours, filterby):
+    binned_df = select_pattern_sequences(set, selected_intervals, selected_durs, selectedhours, filterby)
+    if len(binned_df) <= 1:
+        return mining_jobs.completed([])
+
+    # return the stored result if these sequences were mined before
+    key = pattern_cache_key(binned_df, filterby)
+    selection = (set, selected_intervals, selected_durs, selectedhours, filterby)
+    cached = read_cached_patterns(key)
+    if cached is not None:
+        print("patterns from cache", key)
+        occurrences = read_cached_occurrences(key)
+        if occurrences is not None:
+            cache.put('pattern_occurrences', selection, occurrences)
+        return mining_jobs.completed(cached)
+
+    # mine patterns from sequences, the jobs of the same users, binning and filter run in the same worker, which keeps
+    # the miner of the last selected intervals
+    context = (set, selectedhours, filterby)
+    return mining_jobs.submit(key, mine_seqs, (binned_df, context), partial(rank_patterns, binned_df, key, selection),
+                              affinity=context)
+
 
 
 
@@ -643,6 +850,26 @@ def get_cached_binned(set, filter=False):
 # Flask routes
 #######################################################
 
+# version of every user partition in the store, as seen by this worker
+store_versions = {}
+store_mtime = [None]
+
+# drop the cached results that include users whose data changed in the store since the previous request (ingest.py --append)
+@app.before_request
+def refresh_store():
+    if not intervalstore.has_store(store_directory):
+        return
+    mtime = os.stat(os.path.join(store_directory, 'manifest.json')).st_mtime_ns
+    if mtime == store_mtime[0]:
+        return
+    store_mtime[0] = mtime
+    versions = intervalstore.load_versions(store_directory)
+    changed = set(user for user, version in versions.items() if store_versions.get(user, version) != version)
+    store_versions.update(versions)
+    if len(changed) > 0:
+        print("data changed for users", sorted(changed))
+        cache.invalidate(lambda args: len(changed.intersection(args[0].split(','))) > 0)
+
 @app.route("/")
 def client():
     return send_from_directory('client/public', 'index.html')
@@ -661,6 +888,12 @@ def get_groups():
     return jsonify(groupdict)
 
 
+# return hit, miss and eviction counters and memory use of the cached functions
+@app.route("/cache_stats", methods=['GET'])
+def cache_stats():
+    return jsonify(cache.stats())
+
+
 # return events and corresponding atttributes
 @app.route("/get_events_attributes", methods=['GET'])
 def json_events():
@@ -672,6 +905,7 @@ def json_events():
 # return mean duration and frequency for each interval by day (sid), will be used to show attribute matrices
 @app.route("/get_attr_matrices/<set>", methods=['GET'])
 def get_attr_matrices(set):
+    set = canonical_set(set)
     binned_df = get_cached_binned(set)
 
     # compute df with total daily duration and frequency for each interval
@@ -696,20 +930,9 @@ def get_attr_matrices(set):
 @app.route("/get_summary_data/<set>/<selected_intervals>/<selected_durs>/<selectedhours>", methods=["GET"])
 def get_summary_data(set, selected_intervals, selected_durs, selectedhours):
     print("loading summary data")
-    if selectedhours == "undefined":
-        binned_df = get_cached_binned(set, selected_intervals)
-        selecteddurs = json.loads(selected_durs)
-         # filter the dataframe on selected durations, if no duration is selected for a selected interval, include all durations
-        for key in selecteddurs:
-            interval = key.replace("-", "/")
-            durations = selecteddurs[key]
-            intervaldf = binned_df.loc[binned_df['value'] == interval]
-            intervaldf = intervaldf.loc[(float(durations[0]) <= intervaldf['duration'].astype(float)) & (intervaldf['duration'].astype(float) <= float(durations[1]))]
-            binned_df = binned_df.loc[binned_df['value'] != interval]
-            binned_df = pd.concat([binned_df, intervaldf])
-        binned_df['duration'] = (binned_df['end_time'] - binned_df['start_time']).astype('timedelta64[m]')
-    else:
-        binned_df = bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours)
+    set, selected_intervals = canonical_set(set), canonical_intervals(selected_intervals)
+    selected_durs, selectedhours = canonical_durs(selected_durs), canonical_hours(selectedhours)
+    binned_df = select_sequences(set, selected_intervals, selected_durs, selectedhours)
 
     # compute df with total daily duration and frequency for each selected interval
     summeddur = binned_df.groupby(by=['sid', 'value']).duration.sum().reset_index()
@@ -731,99 +954,85 @@ def get_summary_data(set, selected_intervals, selected_durs, selectedhours):
 def get_pattern_data(set, selected_intervals, selected_durs, selectedhours, filterby):
     filterby = json.loads(filterby).replace("-", "/") 
     print("mine patterns")
-    # add sequence ids based on selected timeframe
-    if selectedhours == "undefined":
-        binned_df = get_cached_binned(set, selected_intervals)
-        selecteddurs = json.loads(selected_durs)
-         # filter the dataframe on selected durations, if no duration is selected for a selected interval, include all durations
-        for key in selecteddurs:
-            interval = key.replace("-", "/")
-            durations = selecteddurs[key]
-            intervaldf = binned_df.loc[binned_df['value'] == interval]
-            intervaldf = intervaldf.loc[(float(durations[0]) <= intervaldf['duration'].astype(float)) & (intervaldf['duration'].astype(float) <= float(durations[1]))]
-            binned_df = binned_df.loc[binned_df['value'] != interval]
-            binned_df = pd.concat([binned_df, intervaldf])
-        binned_df['duration'] = (binned_df['end_time'] - binned_df['start_time']).astype('timedelta64[m]')
-    else:
-        binned_df = bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours)
-
-    if len(binned_df) > 1:
-        # filter df by interval of interest (optional)
-        if filterby != 'all':
-            for sequence in binned_df['sid'].unique():
-                seqdf = binned_df.loc[binned_df['sid'] == sequence]
-                if filterby not in seqdf['value'].unique():
-                    binned_df = binned_df.loc[binned_df['sid'] != sequence]
-
-        # mine patterns from sequences
-        ruledf = mine_seqs(binned_df)
-        # format resulting pattern csv file into pandas dataframe
-        ruledf = format_patterns()
-
-        # query the patterns to find the accurate support
-        print("ruledf", ruledf)
-        finalrules = pd.DataFrame()
-        for pattern_id in ruledf['pattern_id'].unique():
-            print("pattern_id", pattern_id)
-            pattern_df = ruledf.loc[ruledf['pattern_id'] == pattern_id]
-            if ('c' in pattern_df.iloc[0]['relations']) or ('s' in pattern_df.iloc[0]['relations']):
-                print(pattern_df.iloc[0]['relations'])
-                highlight, support = query(binned_df, pattern_df['interval'].tolist(), pattern_df.iloc[0]['relations'])
-                print("support", highlight, support)
-            # pattern_df['highlight'] = [highlight] * len(pattern_df)
-                pattern_df['support'] = [support] * len(pattern_df)
-            finalrules = pd.concat([finalrules, pattern_df])
-        print("finalrules", finalrules)
-
-        # retrieve the five patterns with highest vertical support
-        if len(finalrules) > 0: 
-            finalrules['support'] = finalrules['support'].astype(float)
-            supp = finalrules.groupby(by=['pattern_id'])['support'].first().sort_values(ascending=False)
-            order = supp.index.tolist()
-            label_dict = {}
-            for i in range(len(order)):
-                label_dict[order[i]] = i
-            finalrules = finalrules.replace({"pattern_id" : label_dict})
-            finalrules = finalrules.sort_values(['pattern_id']).reset_index(drop=True)
-            finalrules = finalrules.loc[finalrules['pattern_id'] <= 10]
-    else:
-        finalrules = pd.DataFrame()
-    print("finalrules", finalrules)
-    finalrules = finalrules.to_json(orient='records')
-    finalrules = json.loads(finalrules)
+    set, selected_intervals = canonical_set(set), canonical_intervals(selected_intervals)
+    selected_durs, selectedhours = canonical_durs(selected_durs), canonical_hours(selectedhours)
+    # mine the patterns in the process pool and wait for the job
+    job_id = submit_pattern_job(set, selected_intervals, selected_durs, selectedhours, filterby)
+    finalrules = mining_jobs.wait(job_id)
     return jsonify(finalrules)
 
 
+# start mining the patterns of a selection (the arguments of get_pattern_data) in the background, returns the id of the job,
+# its progress is polled with /get_pattern_job/<job_id> and its patterns are fetched with /get_pattern_job_result/<job_id>
+@app.route("/submit_pattern_job/<set>/<selected_intervals>/<selected_durs>/<selectedhours>/<filterby>", methods=["POST"])
+def submit_pattern_job_route(set, selected_intervals, selected_durs, selectedhours, filterby):
+    filterby = json.loads(filterby).replace("-", "/")
+    set, selected_intervals = canonical_set(set), canonical_intervals(selected_intervals)
+    selected_durs, selectedhours = canonical_durs(selected_durs), canonical_hours(selectedhours)
+    job_id = submit_pattern_job(set, selected_intervals, selected_durs, selectedhours, filterby)
+    return jsonify(mining_jobs.status(job_id))
+
+# return the state ('queued', 'running', 'done' or 'failed') and progress of a mining job
+@app.route("/get_pattern_job/<job_id>", methods=["GET"])
+def get_pattern_job(job_id):
+    status = mining_jobs.status(job_id)
+    if status is None:
+        return make_response(jsonify({'error': 'unknown job ' + job_id}), 404)
+    return jsonify(status)
+
+# return the patterns of a mining job that is done, like get_pattern_data. Returns the state of the job with status 202
+# while it is queued or running, and with status 500 if it failed
+@app.route("/get_pattern_job_result/<job_id>", methods=["GET"])
+def get_pattern_job_result(job_id):
+    status, finalrules = mining_jobs.result(job_id)
+    if status is None:
+        return make_response(jsonify({'error': 'unknown job ' + job_id}), 404)
+    if status['state'] == 'failed':
+        return make_response(jsonify(status), 500)
+    if status['state'] != 'done':
+        return make_response(jsonify(status), 202)
+    return jsonify(finalrules)
+
 # return the dataframe for radial clustering, which includes the selected intervals and the cluster label
 @app.route("/get_intervals/<set>/<selected_intervals>", methods=["GET"])
 def get_intervals(set, selected_intervals):
+    set, selected_intervals = canonical_set(set), canonical_intervals(selected_intervals)
     radial_df = get_radial_df(set, selected_intervals)
     radial_df = radial_df.to_json(orient='records')
     radial_df = json.loads(radial_df)
     radial_df = jsonify(radial_df)
     return radial_df
 
-# return the ids from events that adhere to the selected pattern (eventlist + relation), by querying the pattern
+# return the mined patterns of the selection, with their vertical support and the ids of the events of all their
+# instances. The optional filterby argument (?filterby=<interval>) selects the patterns of get_pattern_data with that
+# filterby, by default 'all'. Empty if the patterns of the selection have not been mined
+@app.route("/get_pattern_occurrences/<set>/<selected_intervals>/<selected_durs>/<selectedhours>", methods=["GET"])
+def pattern_occurrences_route(set, selected_intervals, selected_durs, selectedhours):
+    set, selected_intervals = canonical_set(set), canonical_intervals(selected_intervals)
+    selected_durs, selectedhours = canonical_durs(selected_durs), canonical_hours(selectedhours)
+    filterby = request.args.get('filterby', 'all').replace("-", "/")
+    occurrences = get_pattern_occurrences(set, selected_intervals, selected_durs, selectedhours, filterby) or {}
+    return jsonify([dict(occurrence, intervals=list(intervals), relations=relations)
+                    for (intervals, relations), occurrence in occurrences.items()])
+
+# return the ids from events that adhere to the selected pattern (eventlist + relation), from the instances found by the miner or by querying the pattern
+# (the optional filterby argument is the one of get_pattern_occurrences)
 @app.route("/highlight_patterns/<set>/<selected_intervals>/<selected_durs>/<selectedhours>/<eventlist>/<relations>", methods=["GET"])
 def highlight_patterns(set, selected_intervals, selected_durs, selectedhours, eventlist, relations):
-    if selectedhours == "undefined":
-        binned_df = get_cached_binned(set, selected_intervals)
-        selecteddurs = json.loads(selected_durs)
-         # filter the dataframe on selected durations, if no duration is selected for a selected interval, include all durations
-        for key in selecteddurs:
-            interval = key.replace("-", "/")
-            durations = selecteddurs[key]
-            intervaldf = binned_df.loc[binned_df['value'] == interval]
-            intervaldf = intervaldf.loc[(float(durations[0]) <= intervaldf['duration'].astype(float)) & (intervaldf['duration'].astype(float) <= float(durations[1]))]
-            binned_df = binned_df.loc[binned_df['value'] != interval]
-            binned_df = pd.concat([binned_df, intervaldf])
-    else:
-        binned_df = bin_intervals_custom(set, selected_intervals, selected_durs, selectedhours)
+    set, selected_intervals = canonical_set(set), canonical_intervals(selected_intervals)
+    selected_durs, selectedhours = canonical_durs(selected_durs), canonical_hours(selectedhours)
     eventlist = json.loads(eventlist)
     new_eventlist = []
     for event in eventlist:
         new_eventlist.append(event.replace("-", "/") )
-    highlight_ids, support = query(binned_df, new_eventlist, relations)
+    # answer from the instances found by the miner if the pattern was mined for this selection, otherwise query it
+    filterby = request.args.get('filterby', 'all').replace("-", "/")
+    occurrences = get_pattern_occurrences(set, selected_intervals, selected_durs, selectedhours, filterby)
+    if occurrences is not None and (tuple(new_eventlist), relations) in occurrences:
+        print("select", new_eventlist, relations, "from mined occurrences")
+        return jsonify(occurrences[(tuple(new_eventlist), relations)]['eids'])
+    index = get_interval_index(set, selected_intervals, selected_durs, selectedhours)
+    highlight_ids, support = query(index, new_eventlist, relations)
     print("select", new_eventlist, relations)
     highlight_ids = jsonify(highlight_ids)
     return highlight_ids
@@ -27,6 +27,9 @@ import pandas as pd
 
 
 class TI:
+    # no instance dict, there is a TI object for every time interval
+    __slots__ = ['sym', 'start', 'end']
+
     # Constructor to initialize the TI object
     def __init__(self, sym="", start=None, end=None):
         self.sym = sym
@@ -62,6 +65,8 @@ class TI:
 
 
 class TI_node:
+    __slots__ = ['ti', 'next', 'ant']
+
     # Constructor to initialize the TI_node object
     def __init__(self, sym="", start=None, end=None):
         self.ti = TI(sym, start, end)
@@ -18,40 +18,54 @@ https://doi.org/10.1016/j.eswa.2020.114276.
 Abstract: Time-interval-related pattern (TIRP) mining algorithms find patterns such as “A starts B” or “A overlaps B”. The discovery of TIRPs is computationally highly demanding. In this work, we introduce a new efficient algorithm for mining TIRPs, called vertTIRP which combines an efficient representation of these patterns, using their temporal transitivity properties to manage them, with a pairing strategy that sorts the temporal relations to be tested, in order to speed up the mining process. Moreover, this work presents a robust definition of the temporal relations that eliminates the ambiguities with other relations when taking into account the uncertainty in the start and end time of the events (epsilon-based approach), and includes two constraints that enable the user to better express the types of TIRPs to be learnt. An experimental evaluation of the method was performed with both synthetic and real datasets, and the results show that vertTIRP requires significantly less computation time than other state-of-the-art algorithms, and is an effective approach.
 Keywords: Time Interval Related Patterns; Temporal data mining; Sequential pattern mining; Temporal relations
 """
-from vertTirp.ti.ti import TI
+from sys import intern
 from pandas import Timedelta
 from vertTirp.tirp.allen_relationsEPS import ttu
 
-__slots__ = ['ti', 'r', 'first', 'max_last']
+
 class TIRP:
+    # A tirp instance only stores its last time interval and points to the instance it extends (its parent), which
+    # holds the previous time intervals, so extending an instance does not copy them. The relations between all the
+    # items are packed in one string (interned, as all instances of a tirp have the same relations)
+    __slots__ = ['parent', 'last', 'rel', 'first', 'max_last']
 
     # Constructor to initialize a time interval related pattern or TIRP
 
-    def __init__(self, ti, first, max_last, r=None):
-        self.ti = ti  # [ti] a list of time intervals list sorted lexicographically
-        # where each ti is a TI object with a corresponding start, end and sym
-
-        if not r:
-            r = []
+    def __init__(self, last, first, max_last, rel="", parent=None):
+        self.parent = parent  # the tirp instance without the last time interval, None for a single time interval
+        self.last = last  # the last time interval, a TI object with a corresponding start, end and sym
 
-        self.r = r  # relation list between all the items, as in the Karma-Lego algorithm
+        self.rel = rel  # relation string between all the items, as in the Karma-Lego algorithm
 
         self.first = first  # first of all the symbols time, the first of firsts
         self.max_last = max_last  # latest end_time of all the symbols the max_last
 
-    def my_copy(self):
+    @property
+    def ti(self):
         """
-        Performs a deep copy of self
-        :return: a deep copy of self
+        :return: the list of time intervals sorted lexicographically
         """
-        new_r = [i for i in self.r]
-
-        # shallow copy
-        # new_ti = self.ti[:]
+        ti = []
+        tirp = self
+        while tirp is not None:
+            ti.append(tirp.last)
+            tirp = tirp.parent
+        ti.reverse()
+        return ti
+
+    @property
+    def r(self):
+        """
+        :return: the relation list between all the items
+        """
+        return list(self.rel)
 
-        # deep copy
-        new_ti = [TI(t.sym, t.start, t.end) for t in self.ti]
-        return TIRP(new_ti, self.first, self.max_last, new_r)
+    def my_copy(self):
+        """
+        Performs a copy of self, the time intervals and the parent instance are shared as they are not modified
+        :return: a copy of self
+        """
+        return TIRP(self.last, self.first, self.max_last, self.rel, self.parent)
 
     def __lt__(self, tirp):
         """
@@ -86,7 +100,7 @@ class TIRP:
         returns relation as string
         :return: returns relation as string
         """
-        return "".join(str(x) for x in self.r)
+        return self.rel
 
     def get_duration(self, time_mode=True):
         """
@@ -115,7 +129,7 @@ class TIRP:
         """
 
         # calc and assign the last relation
-        c_rel, status_rel = allen.calc_rel(self.ti[-1], s_ti, eps, min_gap, max_gap, time_mode)
+        c_rel, status_rel = allen.calc_rel(self.last, s_ti, eps, min_gap, max_gap, time_mode)
 
         # the s-extension case
         if not mine_last_equal and c_rel == "e":
@@ -125,17 +139,6 @@ class TIRP:
             # max gap or min gaps exceeded
             return None, status_rel
 
-        # ini new relation
-        new_rel = [nr for nr in self.r]
-        new_rel.extend([""] * len(self.ti))
-
-        new_rel[-1] = c_rel
-
-        # copy if self.ti
-        new_ti = [TI(n.sym, n.start, n.end) for n in self.ti]
-        # appends s_ti
-        new_ti.append(s_ti)
-
         # determine the maximum end time
         new_max_last = s_ti.end
         if new_max_last < self.max_last:
@@ -145,32 +148,42 @@ class TIRP:
         if ttu(new_max_last-self.first, time_mode) > max_duration:
             return None, 1
 
-        size_rel = len(new_rel)
-        size_sym = len(new_ti)
-
-        r_idx = 1
-        temp = size_sym - r_idx
-        first_pos = int(((temp ** 2 - temp) / 2) - 1)
-        while first_pos >= 0:
-            second_pos = size_rel - r_idx
-            pos_to_assign = second_pos - 1
-            existent_node = new_ti[temp - 2]
+        # the relations of the previous time intervals with s_ti, from the last one to the first one. The relation
+        # of an existent time interval with the next one is the last relation of the instance that ends with the next
+        new_rels = [c_rel]
+        next_tirp = self
+        existent = self.parent
+        while existent is not None:
             if allen.trans:
-                possible_rels = allen.get_possible_rels(new_rel[first_pos], new_rel[second_pos])
-                c_rel, status_rel = allen.assign_rel(existent_node, s_ti, possible_rels, eps, min_gap, max_gap, time_mode)
+                possible_rels = allen.get_possible_rels(next_tirp.rel[-1], new_rels[-1])
+                c_rel, status_rel = allen.assign_rel(existent.last, s_ti, possible_rels, eps, min_gap, max_gap, time_mode)
             else:
                 # calc and assign the last relation
-                c_rel, status_rel = allen.calc_rel(existent_node, s_ti, eps, min_gap, max_gap, time_mode)
+                c_rel, status_rel = allen.calc_rel(existent.last, s_ti, eps, min_gap, max_gap, time_mode)
 
             if status_rel < 3:
                 # max gap or min gaps exceeded
                 return None, status_rel
 
-            # assigns the relation to the position
-            new_rel[pos_to_assign] = c_rel
-
-            r_idx += 1
-            temp = size_sym - r_idx
-            first_pos = int(((temp ** 2 - temp) / 2) - 1)
-
-        return (TIRP(new_ti, new_ti[0].start, new_max_last, new_rel)), 3
+            new_rels.append(c_rel)
+            next_tirp = existent
+            existent = existent.parent
+
+        new_rels.reverse()
+        return TIRP(s_ti, self.first, new_max_last, intern(self.rel + "".join(new_rels)), self), 3
+
+
+def tirp_of(tis, rel):
+    """
+    Builds a tirp instance from a list of time intervals
+    :param tis: the list of time intervals sorted lexicographically
+    :param rel: relation string between all the time intervals
+    :return: the tirp instance of the last time interval, whose parents are the instances of the previous ones
+    """
+    tirp = None
+    max_last = tis[0].end
+    for i, ti in enumerate(tis):
+        if ti.end > max_last:
+            max_last = ti.end
+        tirp = TIRP(ti, tis[0].start, max_last, rel[:i * (i + 1) // 2], tirp)
+    return tirp
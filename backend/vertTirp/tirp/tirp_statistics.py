@@ -22,13 +22,14 @@ Keywords: Time Interval Related Patterns; Temporal data mining; Sequential patte
 
 from numpy import mean
 
-__slots__ = ['time_mode', 'sequence_events_tirps_dict', 'sum_ver_supp', 'sum_hor_per_seq', 'last_modified',
-             'sum_mean_duration','n_instances_per_seq','mean_duration']
 class TIRPstatistics:
     """
     This class is designed to store sidlist indicators, such as a vertical and horizontal supports,
     and a mean duration of a given TIRP
     """
+    __slots__ = ['time_mode', 'sequence_events_tirps_dict', 'sum_ver_supp', 'sum_hor_per_seq', 'last_modified',
+                 'sum_mean_duration', 'n_instances_per_seq', 'mean_duration']
+
     def __init__(self, time_mode=True):
 
         #   1- timestamp mode, 2- datetime mode 3- number mode(e.g. number of frame)
@@ -92,6 +93,24 @@ class TIRPstatistics:
         self.sum_hor_per_seq[seq_id] += 1
         return self.sum_ver_supp
 
+    def remap_eids(self, remap):
+        """
+        Renumbers the event ids of the tirps
+        :param remap: a dict where key is a sequence id and value is a list with the new event id of every old one
+        """
+        self.sequence_events_tirps_dict = {seq_id: {remap[seq_id][eid]: tirps for eid, tirps in events_tirps.items()}
+                                           for seq_id, events_tirps in self.sequence_events_tirps_dict.items()}
+
+    def get_instances(self):
+        """
+        Returns all instances of the tirp
+        :return: a generator of (sequence id, tirp) tuples, per sequence in order of appearance
+        """
+        for seq_id, events_tirps in self.sequence_events_tirps_dict.items():
+            for tirps in events_tirps.values():
+                for tirp in tirps:
+                    yield seq_id, tirp
+
     def get_mean_hor_support(self, events_per_sequence):
         """
         :param events_per_sequence: a dictionary where key is a sequence id and value is number of items in sequence
@@ -119,10 +138,8 @@ class TIRPstatistics:
         """
         # append the last mean_duration that have not been added yet
         if self.last_modified != -1:  # not empty sequence
-            for sum, n_inst in zip(self.sum_mean_duration, self.n_instances_per_seq):
-                # we can calculate the mean duration of the previous one
-                self.mean_duration.append(sum/n_inst)
-
+            # recomputed on every call, so that calling it more than once does not add the means again
+            self.mean_duration = [sum/n_inst for sum, n_inst in zip(self.sum_mean_duration, self.n_instances_per_seq)]
             return self.mean_duration
         else:  # empty sequence
             return [0]
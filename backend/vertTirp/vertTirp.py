@@ -21,26 +21,48 @@ Keywords: Time Interval Related Patterns; Temporal data mining; Sequential patte
 """
 
 import vertTirp.vertTirp_sidlist as sl
+import vertTirp.vertTirp_columnar as columnar
+import vertTirp.vertTirp_pairs as pairs
 from vertTirp.vertTirp_node import VertTirpNode
 from vertTirp.tirp.allen_relationsEPS import ttu
-from numpy import ceil
+from numpy import ceil, mean
 import vertTirp.tirp.allen_relationsEPS as aleps
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import heapq
 
 MAXGAP = 3155695200
 MAXDURATION = 3155695200
 MIN_DURATION = 0
 
+# the miner of a worker process of VertTIRP.mine_branches, with the vertical database, it is shipped once per worker
+worker_miner = None
+
+
+def init_branch_worker(miner):
+    global worker_miner
+    worker_miner = miner
+
+
+def mine_branch_worker(i, avoid_same_var_states):
+    node, tirp_count = worker_miner.mine_branch(i, avoid_same_var_states)
+    # the node is attached to the tree of the miner in the main process
+    node.parent = None
+    return node, tirp_count
+
+
 class VertTIRP:
     """
      The implementation of the VertTIRP algorithm
     """
     __slots__ = ['time_mode', 'out_file', 'min_sup_rel', 'min_confidence', 'min_gap', 'max_gap', 'min_duration',
                  'max_duration', 'max_length', 'min_length', 'eps', 'events_per_sequence',
-                 'tirp_count', 'min_sup', 'f1', 'vertical_db', 'tree','allen']
+                 'tirp_count', 'min_sup', 'f1', 'vertical_db', 'tree','allen', 'columnar', 'top_k', 'top_supports',
+                 'mined', 'avoid_same_var_states', 'sequences', 'sequence_tis', 'symbols']
 
     def __init__(self, time_mode=1, out_file=None, min_sup_rel=0.5, min_confidence=-1, min_gap=0, max_gap=MAXGAP,
                  min_duration=MIN_DURATION, max_duration=MAXDURATION,
-                 max_length=-1, min_length=1, eps=500, dummy_calc=False, ps="mocfbesl", trans=True):
+                 max_length=-1, min_length=1, eps=500, dummy_calc=False, ps="mocfbesl", trans=True, columnar=False,
+                 top_k=-1):
 
         self.out_file = out_file  # output file
         self.events_per_sequence = dict()   # necessary for relative horizontal support
@@ -63,11 +85,28 @@ class VertTIRP:
         self.tree = VertTirpNode()  # we will save the patterns in a tree structure
 
         self.time_mode = time_mode  #  1- timestamp mode, 2- datetime mode 3- number mode(e.g. number of frame)
+        # whether to use the columnar vertical database (vertTirp_columnar) instead of VertTirpSidList
+        self.columnar = columnar
+        # only keep the top_k tirps (of at least min_length) with the highest vertical support, -1 for all frequent tirps
+        self.top_k = top_k
+        # min heap with the vertical supports of the best top_k tirps found so far
+        self.top_supports = []
+        # what remine needs of the last mining: 'patterns' or 'pairs' (None before mining), its avoid_same_var_states,
+        # the sequence names, the time intervals of every sequence that meet the duration constraints (in event id
+        # order) and the symbols of all time intervals
+        self.mined = None
+        self.avoid_same_var_states = True
+        self.sequences = []
+        self.sequence_tis = dict()
+        self.symbols = set()
 
         assert min_gap >= 0 and max_gap >= 0
         if min_gap != 0 or max_gap != 0:
             assert (min_gap < max_gap)
 
+        if columnar and dummy_calc:
+            raise ValueError("the columnar vertical database only supports the pairing strategies (dummy_calc=False)")
+
         # establish pairing strategy
         if not dummy_calc:
             self.allen = aleps.AllenPairing(dummy_calc, trans, eps, ps)
@@ -92,7 +131,33 @@ class VertTIRP:
             else:
                 self.tree.print_tree_bfs(self.tree, self.min_length, None,  self.events_per_sequence)
 
-    def mine_patterns(self, list_of_ti_seqs, list_of_seqs, avoid_same_var_states=True):
+    def get_occurrences(self):
+        """
+        Returns the discovered tirps with their instances, in the order in which print_patterns(dfs=True) prints them
+        :return: a list of (symbols, relation string, sidlist, tirp statistics) tuples, where the instances of a tirp
+        are stored per sequence id and event id in tirp_statistics.sequence_events_tirps_dict
+        """
+        occurrences = []
+        self.tree.collect_occurrences(self.min_length, occurrences)
+        return occurrences
+
+    def get_results(self):
+        """
+        Returns the discovered tirps as columns, in the order in which print_patterns(dfs=True) prints them
+        :return: a dict of equally long lists: 'symbols' (the list of symbols of a tirp), 'relations' (the relation
+        string), 'ver_support' (relative vertical support), 'hor_support' (mean relative horizontal support) and
+        'mean_duration' (mean of the mean durations per sequence, in seconds for time_mode 1 and 2)
+        """
+        results = {'symbols': [], 'relations': [], 'ver_support': [], 'hor_support': [], 'mean_duration': []}
+        for symbols, rel, sidlist, tirp_stat in self.get_occurrences():
+            results['symbols'].append(list(symbols))
+            results['relations'].append(rel)
+            results['ver_support'].append(sidlist.get_ver_support(tirp_stat))
+            results['hor_support'].append(sidlist.get_mean_hor_support(self.events_per_sequence, tirp_stat))
+            results['mean_duration'].append(float(mean(tirp_stat.get_mean_duration())))
+        return results
+
+    def mine_patterns(self, list_of_ti_seqs, list_of_seqs, avoid_same_var_states=True, progress=None, processes=1):
         """
         A function to mine patterns.
         :param list_of_ti_seqs: a list of time intervals for each sequence
@@ -100,23 +165,329 @@ class VertTIRP:
         :param avoid_same_var_states: avoid mining states of the same variable, such as
         cgm.a  cgm.b cgm.c, so that at least one variable will be between them, e.g.
         cgm.a  CH.a cgm.b CH.a cgm.c
+        :param progress: optional function that is called with (number of mined branches, number of branches) before
+        the first and after every branch of a frequent 1-size item
+        :param processes: number of processes that mine the branches of the frequent 1-size items in parallel,
+        None for the number of cores. The tree and the tirp count are the same as with 1 process
         :return: A tree (which store tirps) is constructed and the number of tirps is returned.
         """
 
         # Scans SDB to create V(SDB) to identify F1, the list of frequent items
         self.to_vertical(list_of_ti_seqs, list_of_seqs)
+        self.mined, self.avoid_same_var_states = 'patterns', avoid_same_var_states
+
+        if progress is not None:
+            progress(0, len(self.f1))
+        if processes != 1 and len(self.f1) > 1:
+            branches = self.mine_branches(avoid_same_var_states, progress, processes)
+        else:
+            branches = []
+            # depth first tree traversal to mine patterns
+            for i in range(len(self.f1)):
+                branches.append(self.mine_branch(i, avoid_same_var_states))
+                if progress is not None:
+                    progress(i + 1, len(self.f1))
+
+        # we will save patterns in the self.tree, in the order of self.f1
+        for node, tirp_count in branches:
+            node.parent = self.tree
+            self.tree.add_child(node)
+            self.tirp_count += tirp_count
+
+        if self.top_k != -1:
+            self.keep_top_k()
+        return self.tirp_count
+
+    def mine_pairs(self, list_of_ti_seqs, list_of_seqs, avoid_same_var_states=True, progress=None):
+        """
+        Mines the patterns of at most two time intervals with one sweep over every sequence (see vertTirp_pairs),
+        instead of the depth first search of mine_patterns.
+        :param list_of_ti_seqs: a list of time intervals for each sequence
+        :param list_of_seqs: a list of sequence names
+        :param avoid_same_var_states: see mine_patterns
+        :param progress: optional function that is called with (0, 1) before and (1, 1) after the sweep
+        :return: A tree (which store tirps) is constructed and the number of tirps is returned. The tree and the
+        tirp count are the same as with mine_patterns and max_length=2
+        """
+        if not isinstance(self.allen, aleps.AllenPairing):
+            raise ValueError("mine_pairs only supports the pairing strategies (dummy_calc=False)")
+
+        # Scans SDB to create V(SDB) to identify F1, the list of frequent items
+        self.to_vertical(list_of_ti_seqs, list_of_seqs)
+        self.mined, self.avoid_same_var_states = 'pairs', avoid_same_var_states
 
-        procs = []
+        if progress is not None:
+            progress(0, 1)
+        self.add_pairs(list_of_ti_seqs, list_of_seqs, set(self.f1), avoid_same_var_states)
+        if progress is not None:
+            progress(1, 1)
+        self.tirp_count = self.tree.count_tirps(self.min_length)
 
-        # depth first tree traversal to mine patterns
-        for i in range(len(self.f1)):
-            # we will save patterns in the self.tree
-            self.dfs_pruning(self.vertical_db[self.f1[i]], self.f1,
-                                 VertTirpNode(patt=str(self.vertical_db[self.f1[i]].seq_str), pat_len=1, parent=self.tree,
-                                              sidlist=self.vertical_db[self.f1[i]]), self.tree, avoid_same_var_states)
+        if self.top_k != -1:
+            self.keep_top_k()
+        return self.tirp_count
 
+    def add_pairs(self, list_of_ti_seqs, list_of_seqs, new_syms, avoid_same_var_states=True):
+        """
+        Sweeps the sequences for the pairs of frequent items with at least one item of new_syms, and adds the nodes of
+        the new items and of the new pairs to self.tree
+        :param list_of_ti_seqs: a list of time intervals for each sequence
+        :param list_of_seqs: a list of sequence names
+        :param new_syms: a set of frequent items whose pairs are not in the tree yet
+        :param avoid_same_var_states: see mine_patterns
+        """
+        # the frequent items that every frequent item is extended with
+        extensions = dict()
+        if self.max_length == -1 or self.max_length >= 2:
+            for sym in self.f1:
+                extensions[sym] = {s for s in self.f1 if (sym in new_syms or s in new_syms) and
+                                   not self.same_variable(s, sym, avoid_same_var_states)}
+
+        table = columnar.interval_table(list_of_ti_seqs, list_of_seqs, self.time_mode, self.min_duration,
+                                        self.max_duration, dict())
+        supports = {sym: self.vertical_db[sym].get_support() for sym in self.f1}
+        candidates = pairs.sweep(table, extensions, self.allen, self.eps, self.min_gap, self.max_gap, self.max_duration,
+                                 self.min_sup, self.min_confidence, supports)
+
+        # we will save patterns in the self.tree, the pairs of an item in the order of self.f1 like dfs_pruning
+        n_sequences = len(list_of_seqs)
+        nodes = {node.sidlist.seq_str[0]: node for node in self.tree.child_nodes}
+        self.tree.child_nodes = []
+        for sym in self.f1:
+            if sym not in nodes:
+                sidlist = self.vertical_db[sym]
+                nodes[sym] = VertTirpNode(patt=str(sidlist.seq_str), pat_len=1, parent=self.tree, sidlist=sidlist)
+            node = nodes[sym]
+            self.tree.add_child(node)
+
+            children = {child.sidlist.seq_str[-1]: child for child in node.child_nodes}
+            node.child_nodes = []
+            for s in self.f1:
+                if (sym, s) in candidates:
+                    relations, instances = candidates[(sym, s)]
+                    pair_sidlist = pairs.pair_sidlist((sym, s), relations, instances, self.time_mode, n_sequences)
+                    children[s] = VertTirpNode(patt=str(pair_sidlist.seq_str), pat_len=2, parent=node,
+                                               sidlist=pair_sidlist)
+                if s in children:
+                    node.add_child(children[s])
+
+    def remine(self, list_of_ti_seqs, list_of_seqs, progress=None, processes=1):
+        """
+        Mines the patterns of sequences that only differ from the last mined ones (with mine_patterns or mine_pairs)
+        in the symbols of their time intervals, e.g. when an interval type is added to or removed from the selection:
+        the branches of the removed symbols are pruned from the tree and only the branches with an added symbol are
+        mined. The sequences are matched by name and may be added or dropped, e.g. the hour windows that only have
+        intervals of a toggled interval type: the symbols of their time intervals are mined again as well (see
+        changed_symbols). If the other sequences or their time intervals of the other symbols do not match, and with
+        the columnar vertical database or top_k, all patterns are mined again.
+        :param list_of_ti_seqs: a list of time intervals for each sequence
+        :param list_of_seqs: a list of sequence names
+        :param progress: optional function that is called with (0, 1) before and (1, 1) after the mining
+        :param processes: see mine_patterns, only used when all patterns are mined again
+        :return: the number of tirps. The tree and the tirp count are the same as when mining the sequences with a
+        new VertTIRP, the mining mode and avoid_same_var_states are those of the last mining
+        """
+        if self.mined is None:
+            raise ValueError("remine needs the patterns of a previous mine_patterns or mine_pairs")
+        symbols = {its.ti.sym for [item_sets] in list_of_ti_seqs for its in item_sets}
+        added, removed = symbols - self.symbols, self.symbols - symbols
+        remap = None
+        if not self.columnar and self.top_k == -1:
+            changed = self.changed_symbols(list_of_ti_seqs, list_of_seqs, added, removed)
+            added, removed = added | changed, removed | changed
+            remap = self.match_sequences(list_of_ti_seqs, list_of_seqs, added, removed)
+
+        if remap is None:
+            self.events_per_sequence, self.tirp_count, self.f1, self.vertical_db = dict(), 0, [], dict()
+            self.tree, self.top_supports = VertTirpNode(), []
+            self.sequences, self.sequence_tis, self.symbols = [], dict(), set()
+            if self.mined == 'pairs':
+                return self.mine_pairs(list_of_ti_seqs, list_of_seqs, self.avoid_same_var_states, progress)
+            return self.mine_patterns(list_of_ti_seqs, list_of_seqs, self.avoid_same_var_states, progress, processes)
+
+        if progress is not None:
+            progress(0, 1)
+        # prune the branches of the removed symbols and number the event ids as to_vertical numbers them now
+        self.f1 = [sym for sym in self.f1 if sym not in removed]
+        for sym in removed:
+            self.vertical_db.pop(sym, None)
+        self.tree.remove_symbols(removed)
+        # the relative supports are those of the new number of sequences
+        sidlists = list(self.vertical_db.values())
+        self.tree.collect_sidlists(sidlists)
+        for sidlist in {id(sidlist): sidlist for sidlist in sidlists}.values():
+            sidlist.remap_eids(remap)
+            sidlist.set_n_sequences(len(list_of_seqs))
+
+        # the sidlists of the added symbols
+        self.sequences, self.events_per_sequence = list(list_of_seqs), dict()
+        for [item_sets], name in zip(list_of_ti_seqs, list_of_seqs):
+            self.events_per_sequence[name] = item_sets.size
+            for eid, ti in enumerate(self.sequence_tis[name]):
+                if ti.sym in added:
+                    if ti.sym not in self.vertical_db:
+                        self.vertical_db[ti.sym] = sl.VertTirpSidList(self.time_mode)
+                    self.vertical_db[ti.sym].append_item(ti, name, eid)
+        self.symbols = symbols
+        new_syms = set()
+        for sym in added:
+            if sym in self.vertical_db:
+                if self.vertical_db[sym].get_support() >= self.min_sup:
+                    self.vertical_db[sym].set_n_sequences(len(list_of_seqs))
+                    new_syms.add(sym)
+                else:
+                    del self.vertical_db[sym]
+        self.f1 = sorted(self.f1 + list(new_syms))
+
+        if new_syms and self.mined == 'pairs':
+            self.add_pairs(list_of_ti_seqs, list_of_seqs, new_syms, self.avoid_same_var_states)
+        elif new_syms:
+            for node in self.tree.child_nodes:
+                self.extend_branch(node, self.f1, new_syms, self.avoid_same_var_states)
+            branches = {node.sidlist.seq_str[0]: node for node in self.tree.child_nodes}
+            for sym in new_syms:
+                branches[sym] = self.mine_branch(self.f1.index(sym), self.avoid_same_var_states)[0]
+            self.tree.child_nodes = []
+            for sym in self.f1:
+                branches[sym].parent = self.tree
+                self.tree.add_child(branches[sym])
+        if progress is not None:
+            progress(1, 1)
+
+        self.tirp_count = self.tree.count_tirps(self.min_length)
         return self.tirp_count
 
+    def changed_symbols(self, list_of_ti_seqs, list_of_seqs, added, removed):
+        """
+        A sequence that is added or dropped (ti_read skips the sequences with less than two time intervals, so e.g. an
+        hour window with one interval appears when an interval of an added symbol falls in it) changes the instances
+        of all symbols of its time intervals, so these are mined again like the added and removed symbols
+        :return: the set of the symbols of the time intervals of the new and the dropped sequences, apart from the
+        added and removed symbols
+        """
+        changed = set()
+        names = set(list_of_seqs)
+        for [item_sets], name in zip(list_of_ti_seqs, list_of_seqs):
+            if name not in self.sequence_tis:
+                changed.update(its.ti.sym for its in item_sets if self.meets_duration(its.ti))
+        for name in self.sequences:
+            if name not in names:
+                changed.update(ti.sym for ti in self.sequence_tis[name])
+        return changed - added - removed
+
+    def match_sequences(self, list_of_ti_seqs, list_of_seqs, added, removed):
+        """
+        Matches the sequences by name with the last mined sequences, and their time intervals apart from the added and
+        removed symbols (which include the symbols of new and dropped sequences, see changed_symbols). The sequences in
+        both have to keep their order and the absolute minimum support has to stay the same, otherwise patterns of the
+        other symbols may become (in)frequent
+        :return: a dict where key is the name of a sequence in both and value is a list with the event id that every
+        time interval of the last mined sequence has in the new one, or None if the sequences do not match.
+        self.sequence_tis is updated when they do
+        """
+        names = list(list_of_seqs)
+        if max(ceil(self.min_sup_rel * len(names)), 1) != self.min_sup:
+            return None
+        old_names, new_names = set(self.sequences), set(names)
+        if [name for name in names if name in old_names] != [name for name in self.sequences if name in new_names]:
+            return None
+        remap = dict()
+        sequence_tis = dict()
+        for [item_sets], name in zip(list_of_ti_seqs, names):
+            tis = [its.ti for its in item_sets if self.meets_duration(its.ti)]
+            if name not in old_names:
+                sequence_tis[name] = tis
+                continue
+            old_tis = self.sequence_tis[name]
+            old_eids = [eid for eid, ti in enumerate(old_tis) if ti.sym not in removed]
+            new_eids = [eid for eid, ti in enumerate(tis) if ti.sym not in added]
+            if len(old_eids) != len(new_eids):
+                return None
+            remap[name] = [None] * len(old_tis)
+            for old_eid, new_eid in zip(old_eids, new_eids):
+                old, new = old_tis[old_eid], tis[new_eid]
+                if old.sym != new.sym or old.start != new.start or old.end != new.end:
+                    return None
+                remap[name][old_eid] = new_eid
+            sequence_tis[name] = tis
+        self.sequence_tis = sequence_tis
+        return remap
+
+    def extend_branch(self, node, f_l, new_syms, avoid_same_var_states=True):
+        """
+        Adds the extensions with the new frequent items to a mined node and its descendants, like dfs_pruning would
+        have found them with the new items in f_l
+        :param node: a node of self.tree
+        :param f_l: the frequent items that the node is extended with, including the new ones
+        :param new_syms: a set of new frequent items
+        """
+        pat_sidlist = node.sidlist
+        if self.max_length != -1 and pat_sidlist.seq_length + 1 > self.max_length:
+            return
+
+        s_new = dict()
+        for s in f_l:
+            if s in new_syms and not self.same_variable(s, pat_sidlist.seq_str[-1], avoid_same_var_states):
+                s_bm = pat_sidlist.join(self.vertical_db[s], self.allen, self.eps, self.min_gap, self.max_gap, self.max_duration, self.min_sup, self.min_confidence)
+                if s_bm.definitive_discovered_tirp_dict:
+                    s_new[s] = s_bm
+        # the extensions of the descendants do not change without a new extension of the node
+        if not s_new:
+            return
+
+        children = {child.sidlist.seq_str[-1]: child for child in node.child_nodes}
+        s_syms = [s for s in f_l if s in children or s in s_new]
+        node.child_nodes = []
+        for s in s_syms:
+            if s in s_new:
+                s_node = VertTirpNode(patt=str(s_new[s].seq_str), pat_len=s_new[s].seq_length, parent=node,
+                                      sidlist=s_new[s])
+                self.dfs_pruning(s_new[s], s_syms, s_node, node, avoid_same_var_states)
+            else:
+                node.add_child(children[s])
+                self.extend_branch(children[s], s_syms, set(s_new), avoid_same_var_states)
+
+    def mine_branch(self, i, avoid_same_var_states=True):
+        """
+        Mines the patterns that start with the frequent 1-size item self.f1[i]
+        :param i: position of the item in self.f1
+        :param avoid_same_var_states: see mine_patterns
+        :return: the node of the item, with the patterns of the branch as descendants, and the number of tirps in the
+        branch. The node is not added to self.tree
+        """
+        root = VertTirpNode()
+        tirp_count = self.tirp_count
+        self.tirp_count = 0
+        self.dfs_pruning(self.vertical_db[self.f1[i]], self.f1,
+                         VertTirpNode(patt=str(self.vertical_db[self.f1[i]].seq_str), pat_len=1, parent=root,
+                                      sidlist=self.vertical_db[self.f1[i]]), root, avoid_same_var_states)
+        branch_count, self.tirp_count = self.tirp_count, tirp_count
+        return root.child_nodes[0], branch_count
+
+    def mine_branches(self, avoid_same_var_states=True, progress=None, processes=None):
+        """
+        Mines the branches of all frequent 1-size items in a pool of processes. Every worker gets a copy of the miner
+        with the vertical database once, after which the branches are handed out one at a time, starting with the items
+        that have the most intervals, so that a few large branches do not end up in the same worker at the end
+        :param avoid_same_var_states: see mine_patterns
+        :param progress: see mine_patterns
+        :param processes: number of worker processes, None for the number of cores
+        :return: a (node, tirp count) tuple per branch, in the order of self.f1
+        """
+        if self.columnar:
+            sizes = [len(self.vertical_db[sym].elements) for sym in self.f1]
+        else:
+            sizes = [sum(len(eids) for eids in self.vertical_db[sym].definitive_ones_indices_dict.values()) for sym in self.f1]
+        order = sorted(range(len(self.f1)), key=lambda i: sizes[i], reverse=True)
+        branches = [None] * len(self.f1)
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_branch_worker, initargs=(self,)) as pool:
+            futures = {pool.submit(mine_branch_worker, i, avoid_same_var_states): i for i in order}
+            for done, future in enumerate(as_completed(futures)):
+                branches[futures[future]] = future.result()
+                if progress is not None:
+                    progress(done + 1, len(self.f1))
+        return branches
+
     def dfs_pruning(self, pat_sidlist, f_l, node, father, avoid_same_var_states=True):
         """
         Performs the recursive depth first tree traversal, and constructs the self.tree with tirps
@@ -131,23 +502,77 @@ class VertTIRP:
 
         if pat_sidlist.seq_length >= self.min_length:
             self.tirp_count += len(pat_sidlist.definitive_discovered_tirp_dict)
+            if self.top_k != -1:
+                for tirp_stat in pat_sidlist.definitive_discovered_tirp_dict.values():
+                    self.add_top_support(tirp_stat.sum_ver_supp)
 
         s_temp = dict()
 
         #  to control the maximum length
-        if (self.max_length == -1) or ((self.max_length != -1) and ((pat_sidlist.seq_length + 1) <= self.max_length)):
+        if ((self.max_length == -1) or ((self.max_length != -1) and ((pat_sidlist.seq_length + 1) <= self.max_length))) \
+                and self.can_enter_top_k(pat_sidlist):
 
             for s in f_l:
-                if not self.same_variable(s, pat_sidlist.seq_str[-1], avoid_same_var_states):
+                # an extension with s can not have a higher support than s
+                if not self.same_variable(s, pat_sidlist.seq_str[-1], avoid_same_var_states) and \
+                        self.can_enter_top_k(self.vertical_db[s]):
                     s_bm = pat_sidlist.join(self.vertical_db[s], self.allen, self.eps, self.min_gap, self.max_gap, self.max_duration, self.min_sup, self.min_confidence)
-                    if s_bm.definitive_ones_indices_dict:
+                    if s_bm.definitive_discovered_tirp_dict:
                         s_temp[s] = s_bm
 
             s_syms = list(s_temp.keys())
             for j, j_pat in s_temp.items():
+                # the support threshold may have been raised by the previous branches
+                if not self.can_enter_top_k(j_pat):
+                    continue
                 s_node = VertTirpNode(patt=str(j_pat.seq_str), pat_len=j_pat.seq_length, parent=node, sidlist=j_pat)
                 self.dfs_pruning(j_pat, s_syms, s_node, node, avoid_same_var_states)
 
+    def add_top_support(self, support):
+        """
+        Adds the vertical support of a discovered tirp to the heap of the top_k best supports
+        """
+        if len(self.top_supports) < self.top_k:
+            heapq.heappush(self.top_supports, support)
+        elif support > self.top_supports[0]:
+            heapq.heapreplace(self.top_supports, support)
+
+    def can_enter_top_k(self, sidlist):
+        """
+        :param sidlist: a sidlist, its tirps and their extensions have at most the highest support of its tirps
+        :return: False if top_k tirps with a higher support than all tirps of the sidlist have been found already,
+        True otherwise (and without top_k)
+        """
+        if self.top_k == -1 or len(self.top_supports) < self.top_k:
+            return True
+        return max(tirp_stat.sum_ver_supp for tirp_stat in sidlist.definitive_discovered_tirp_dict.values()) >= \
+            self.top_supports[0]
+
+    def keep_top_k(self):
+        """
+        Removes the tirps (of at least min_length) that are not among the top_k with the highest vertical support
+        from the tree, the tirps with the same support as the k-th one are kept. Updates the tirp count.
+        """
+        nodes = [self.tree]
+        supports = []
+        i = 0
+        while i < len(nodes):
+            nodes.extend(nodes[i].child_nodes)
+            if nodes[i].sidlist is not None and nodes[i].pat_len >= self.min_length:
+                supports.extend(s.sum_ver_supp for s in nodes[i].sidlist.definitive_discovered_tirp_dict.values())
+            i += 1
+        if len(supports) <= self.top_k:
+            return
+        threshold = heapq.nlargest(self.top_k, supports)[-1]
+
+        self.tirp_count = 0
+        for node in nodes:
+            if node.sidlist is not None and node.pat_len >= self.min_length:
+                tirps = node.sidlist.definitive_discovered_tirp_dict
+                for rel in [rel for rel, s in tirps.items() if s.sum_ver_supp < threshold]:
+                    del tirps[rel]
+                self.tirp_count += len(tirps)
+
     def same_variable(self, sym1, sym2, avoid_same_var_states=True):
         """
         :param sym1: symbol of the first time interval
@@ -163,6 +588,13 @@ class VertTIRP:
         return sym1_c[0] == sym2_c[0]
 
 
+    def meets_duration(self, ti):
+        """
+        :param ti: a time interval
+        :return: whether the time interval meets the duration constraints
+        """
+        return (ttu(ti.end - ti.start, self.time_mode) >= self.min_duration) and (ttu(ti.end - ti.start, self.time_mode) <= self.max_duration)
+
     def to_vertical(self, list_of_ti_seqs, list_of_seqs):
         """
         Constructs the vertical database representation.
@@ -176,20 +608,29 @@ class VertTIRP:
         """
         eid = 0  # transaction or item-set id
 
-        for [item_sets], name in zip(list_of_ti_seqs, list_of_seqs):
-            self.events_per_sequence[name] = item_sets.size  # necessary for relative horizontal support (for descriptive purposes)
-            for its in item_sets:
-
-                #  duration constraints
-                if (ttu(its.ti.end - its.ti.start, self.time_mode) >= self.min_duration) and (ttu(its.ti.end - its.ti.start, self.time_mode) <= self.max_duration):
-
-                    if not (its.ti.sym in self.vertical_db):
-                        self.vertical_db[its.ti.sym] = sl.VertTirpSidList(self.time_mode)
-                        first_item = True  # sidlist for a new item
-                    self.vertical_db[its.ti.sym].append_item(its.ti, name, eid)
-
-                    eid += 1
-            eid = 0
+        if self.columnar:
+            # all intervals in arrays, with the same event ids and the same duration constraints
+            self.vertical_db = columnar.to_vertical(list_of_ti_seqs, list_of_seqs, self.time_mode, self.min_duration,
+                                                    self.max_duration, self.events_per_sequence)
+        else:
+            self.sequences = list(list_of_seqs)
+            for [item_sets], name in zip(list_of_ti_seqs, list_of_seqs):
+                self.events_per_sequence[name] = item_sets.size  # necessary for relative horizontal support (for descriptive purposes)
+                self.sequence_tis[name] = []
+                for its in item_sets:
+                    self.symbols.add(its.ti.sym)
+
+                    #  duration constraints
+                    if self.meets_duration(its.ti):
+
+                        if not (its.ti.sym in self.vertical_db):
+                            self.vertical_db[its.ti.sym] = sl.VertTirpSidList(self.time_mode)
+                            first_item = True  # sidlist for a new item
+                        self.vertical_db[its.ti.sym].append_item(its.ti, name, eid)
+                        self.sequence_tis[name].append(its.ti)
+
+                        eid += 1
+                eid = 0
 
         # calculate the absolute support based on number of sequences
         n_sequences = len(list_of_seqs)
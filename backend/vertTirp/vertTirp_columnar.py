@@ -0,0 +1,556 @@
+"""
+Columnar vertical database for the vertTIRP algorithm, used by VertTIRP(columnar=True) instead of VertTirpSidList.
+
+All time intervals of the mined sequences are kept in one IntervalTable of numpy arrays. A ColumnarSidList keeps the
+instances (tirps) of a pattern as an array of interval indices, with one column per symbol, and arrays with the relation,
+first start time and maximum end time of every instance. The join of a pattern with a frequent 1-size item extends all
+instances at once: the candidate intervals of every (sequence, event id) are found with a binary search on the sorted
+event ids and start times of the item, and the relations and the gap and duration constraints are computed for all
+candidates with vectorized comparisons.
+
+The join finds the same tirps with the same statistics as VertTirpSidList.join. The instances are kept in the order in
+which VertTirpSidList keeps them, since the first tirp of every (sequence, event id) determines the window of intervals
+that the next join tries (see VertTirpSidList.join).
+"""
+
+import numpy as np
+import pandas as pd
+from vertTirp.tirp.tirp import tirp_of
+from vertTirp.vertTirp_sidlist import MAXGAP, MAXDURATION
+
+# relations are coded as positions in this string
+RELATIONS = 'bmocfesl'
+CODE = {r: i for i, r in enumerate(RELATIONS)}
+NO_REL = -1
+
+
+def to_time_array(values, time_mode):
+    """
+    :param values: start or end times as read by ti_read
+    :param time_mode: 1- timestamp mode, 2- datetime mode 3- number mode(e.g. number of frame)
+    :return: the times as an array, datetimes as int64 nanoseconds
+    """
+    if time_mode == 2:
+        return np.array(values, dtype='datetime64[ns]').view(np.int64)
+    return np.array(values, dtype=np.float64)
+
+
+def seconds(difference, time_mode):
+    # vectorized ttu: differences of datetimes in seconds
+    if time_mode == 2:
+        return difference / 1e9
+    return difference
+
+
+def time_offset(n_seconds, time_mode):
+    # n_seconds as a difference of times, like np.timedelta64(n_seconds, 's') for datetimes
+    if time_mode == 2:
+        return int(n_seconds) * 10 ** 9
+    return n_seconds
+
+
+def expand_ranges(low, high):
+    """
+    :return: two arrays with a pair (i, j) for every j in the range [low[i], high[i]), ordered on i and then j
+    """
+    counts = np.maximum(high - low, 0)
+    pair_first = np.repeat(np.arange(len(low)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return pair_first, np.repeat(low, counts) + offsets
+
+
+def grouped_searchsorted(groups, values, query_groups, query_values, side='left'):
+    """
+    np.searchsorted for an array that is sorted on (group, value)
+    :return: the positions at which the (query group, query value) pairs would be inserted to keep the order
+    """
+    n = len(groups)
+    all_groups = np.concatenate([groups, query_groups])
+    all_values = np.concatenate([values, query_values])
+    # with equal (group, value), the queries go after the elements for side 'right', and before them for side 'left'
+    is_query = np.arange(len(all_groups)) >= n
+    order = np.lexsort((is_query if side == 'right' else ~is_query, all_values, all_groups))
+    is_element = order < n
+    elements_before = np.cumsum(is_element) - is_element
+    positions = np.empty(len(query_groups), dtype=np.int64)
+    positions[order[~is_element] - n] = elements_before[~is_element]
+    return positions
+
+
+def calc_rel(a_start, a_end, b_start, b_end, rels_arr, gr_arr, eps, min_gap, max_gap, time_mode):
+    """
+    Vectorized AllenPairing.calc_rel: the relations between arrays of time intervals a and b, following the pairing
+    strategy rels_arr and gr_arr
+    :return: an array of relation codes (NO_REL if there is no relation) and an array of statuses:
+    3 - ok, 2 - max gap restriction, 1 - otherwise
+    """
+    rel = np.full(len(a_start), NO_REL, dtype=np.int8)
+    status = np.ones(len(a_start), dtype=np.int8)
+    s_s = seconds(b_start - a_start, time_mode)
+    e_e = seconds(b_end - a_end, time_mode)
+    s_e = seconds(b_start - a_end, time_mode)
+    individual = {
+        'm': lambda: np.abs(s_e) <= eps,
+        'o': lambda: s_e < -eps,
+        'c': lambda: e_e < -eps,
+        'f': lambda: np.abs(e_e) <= eps,
+        'e': lambda: np.abs(e_e) <= eps,
+        's': lambda: e_e > eps,
+        'l': lambda: (e_e < -eps) & (eps != 0),
+    }
+    group_cond = {'sel': lambda: np.abs(s_s) <= eps, 'cfmo': lambda: s_s > eps}
+
+    # if b is less than a
+    undecided = ~((b_start < a_start) | ((b_start == a_start) & (b_end < a_end)))
+
+    def assign(mask, r):
+        rel[mask] = CODE[r]
+        status[mask] = 3
+        undecided[mask] = False
+
+    for sentence, g in zip(rels_arr, gr_arr):
+        if g:
+            in_group = group_cond[g]()
+            for words in sentence:
+                if isinstance(words, list):  # mo case
+                    in_mo = in_group & (e_e > eps)
+                    for w in words:
+                        assign(undecided & in_mo & individual[w](), w)
+                else:
+                    assign(undecided & in_group & individual[words](), words)
+        else:  # b condition
+            before = undecided & (s_e > eps)
+            assign(before, 'b')
+            if min_gap != 0:
+                too_close = before & (s_e < min_gap)
+                rel[too_close], status[too_close] = NO_REL, 1
+            if max_gap != MAXGAP:
+                too_far = before & (s_e > max_gap) & (rel == CODE['b'])
+                rel[too_far], status[too_far] = NO_REL, 2
+    return rel, status
+
+
+def assign_rel(allen, rel_ab, a_start, a_end, b_start, b_end, eps, min_gap, max_gap, time_mode):
+    """
+    Vectorized AllenPairing.assign_rel: the relations between arrays of time intervals a and b, where possible_rels
+    follows from the transitivity table and the relation codes rel_ab (between a and its successor, and between that
+    successor and b)
+    :return: an array of relation codes and an array of statuses, see calc_rel
+    """
+    rel = np.full(len(a_start), NO_REL, dtype=np.int8)
+    status = np.ones(len(a_start), dtype=np.int8)
+    combinations, inverse = np.unique(rel_ab, axis=0, return_inverse=True)
+    for i, (first, second) in enumerate(combinations):
+        rows = np.flatnonzero(inverse.ravel() == i)
+        possible_rels = allen.get_possible_rels(RELATIONS[first], RELATIONS[second])
+        args = (a_start[rows], a_end[rows], b_start[rows], b_end[rows])
+        if len(possible_rels) == 1:
+            if possible_rels[0] == 'b':  # Special case with gap
+                b_rel, b_status = calc_rel(*args, [['b']], [None], eps, min_gap, max_gap, time_mode)
+                # b_rel is NO_REL with status 1 if b does not hold, or if it does not meet the min gap
+                other = (b_status == 1) & (seconds(args[2] - args[1], time_mode) <= eps)
+                c_rel, c_status = calc_rel(*args, allen.rels_arr, allen.gr_arr, eps, min_gap, max_gap, time_mode)
+                rel[rows] = np.where(other, c_rel, b_rel)
+                status[rows] = np.where(other, c_status, b_status)
+            else:
+                rel[rows], status[rows] = CODE[possible_rels[0]], 3
+        else:
+            rel[rows], status[rows] = calc_rel(*args, possible_rels[0], possible_rels[1], eps, min_gap, max_gap,
+                                               time_mode)
+    return rel, status
+
+
+class IntervalTable:
+    """
+    The time intervals of all sequences that meet the duration constraints, in order of sequence and event id
+    """
+
+    __slots__ = ['time_mode', 'tis', 'sequences', 'sid', 'eid', 'start', 'end']
+
+    def __init__(self, time_mode, tis, sequences, sid, eid):
+        """
+        :param time_mode: 1- timestamp mode, 2- datetime mode 3- number mode(e.g. number of frame)
+        :param tis: the TI objects of the intervals
+        :param sequences: the sequence names, by sequence code
+        :param sid: sequence code of every interval
+        :param eid: event id of every interval within its sequence
+        """
+        self.time_mode = time_mode
+        self.tis = tis
+        self.sequences = sequences
+        self.sid = np.asarray(sid, dtype=np.int64)
+        self.eid = np.asarray(eid, dtype=np.int64)
+        self.start = to_time_array([ti.start for ti in tis], time_mode)
+        self.end = to_time_array([ti.end for ti in tis], time_mode)
+
+
+def interval_table(list_of_ti_seqs, list_of_seqs, time_mode, min_duration, max_duration, events_per_sequence):
+    """
+    :param list_of_ti_seqs: a list of time intervals of all sequences
+    :param list_of_seqs: a list of sequence names
+    :param time_mode: 1- timestamp mode, 2- datetime mode 3- number mode(e.g. number of frame)
+    :param min_duration: each event interval should have a duration of at least min_duration seconds
+    :param max_duration: each event interval should have a duration of at most max_duration seconds
+    :param events_per_sequence: a dict in which the number of items of every sequence is stored
+    :return: an IntervalTable with the intervals that meet the duration constraints, where the event ids only count
+    these intervals (as in VertTIRP.to_vertical)
+    """
+    tis, sid, eid = [], [], []
+    for code, ([item_sets], name) in enumerate(zip(list_of_ti_seqs, list_of_seqs)):
+        events_per_sequence[name] = item_sets.size
+        for its in item_sets:
+            tis.append(its.ti)
+        eid.extend(range(item_sets.size))
+        sid.extend([code] * item_sets.size)
+    tis = np.array(tis + [None], dtype=object)[:-1]
+    table = IntervalTable(time_mode, tis, list(list_of_seqs), sid, eid)
+
+    #  duration constraints, the event ids only count the intervals that meet them
+    duration = seconds(table.end - table.start, time_mode)
+    keep = np.flatnonzero((duration >= min_duration) & (duration <= max_duration))
+    kept_sid = table.sid[keep]
+    new_sequence = np.r_[True, kept_sid[1:] != kept_sid[:-1]]
+    sequence_start = np.flatnonzero(new_sequence)
+    table.eid[keep] = np.arange(len(keep)) - np.repeat(sequence_start, np.diff(np.r_[sequence_start, len(keep)]))
+    table.tis, table.sid, table.eid = table.tis[keep], table.sid[keep], table.eid[keep]
+    table.start, table.end = table.start[keep], table.end[keep]
+    return table
+
+
+def to_vertical(list_of_ti_seqs, list_of_seqs, time_mode, min_duration, max_duration, events_per_sequence):
+    """
+    Constructs the columnar vertical database representation, like VertTIRP.to_vertical
+    :param list_of_ti_seqs: a list of time intervals of all sequences
+    :param list_of_seqs: a list of sequence names
+    :param time_mode: 1- timestamp mode, 2- datetime mode 3- number mode(e.g. number of frame)
+    :param min_duration: each event interval should have a duration of at least min_duration seconds
+    :param max_duration: each event interval should have a duration of at most max_duration seconds
+    :param events_per_sequence: a dict in which the number of items of every sequence is stored
+    :return: a dict with a ColumnarSidList of every symbol, in order of appearance
+    """
+    table = interval_table(list_of_ti_seqs, list_of_seqs, time_mode, min_duration, max_duration, events_per_sequence)
+    codes, syms = pd.factorize(np.array([ti.sym for ti in table.tis], dtype=object))
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(syms)))[:-1]
+    return {sym: ColumnarSidList.from_intervals(table, sym, rows) for sym, rows in zip(syms, np.split(order, bounds))}
+
+
+class ColumnarSidList:
+    """
+    The instances of a pattern (seq_str), with the interface of VertTirpSidList.
+    elements holds the interval indices of the instances (one column per symbol), rel the position of their relation
+    string in rels, and gen the order in which they were found, which is the order of the statistics.
+    The instances are ordered like the tirps in VertTirpSidList.definitive_ones_indices_dict: by sequence and event id
+    of the last interval, and within those like the lists of tirps.
+    """
+
+    __slots__ = ['table', 'time_mode', 'seq_str', 'seq_length', 'n_sequences', 'elements', 'rel', 'rels', 'first',
+                 'max_last', 'gen', 'definitive_discovered_tirp_dict']
+
+    def __init__(self, table, time_mode=False):
+        self.table = table
+        self.time_mode = time_mode
+        # a sequence of syms
+        self.seq_str = []
+        self.seq_length = 0
+        self.n_sequences = 0
+        self.elements = np.empty((0, 0), dtype=np.int64)
+        self.rel = np.empty(0, dtype=np.int64)
+        self.rels = []
+        self.first = np.empty(0)
+        self.max_last = np.empty(0)
+        self.gen = np.empty(0, dtype=np.int64)
+        # where key is a relation string and value is a ColumnarTirpStatistics
+        self.definitive_discovered_tirp_dict = dict()
+
+    @classmethod
+    def from_intervals(cls, table, sym, rows):
+        """
+        :return: the sidlist of the 1-size pattern sym, with the intervals rows of table
+        """
+        sidlist = cls(table, table.time_mode)
+        sidlist.seq_str = [sym]
+        sidlist.seq_length = 1
+        sidlist.elements = rows.reshape(-1, 1)
+        sidlist.rel = np.zeros(len(rows), dtype=np.int64)
+        sidlist.rels = ['']
+        sidlist.first = table.start[rows]
+        sidlist.max_last = table.end[rows]
+        sidlist.gen = np.arange(len(rows))
+        sidlist.definitive_discovered_tirp_dict[" "] = ColumnarTirpStatistics(sidlist, 0)
+        return sidlist
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.elements, self.rel, self.first, self.max_last, self.gen))
+
+    def set_n_sequences(self, n_sequences):
+        self.n_sequences = n_sequences
+
+    def get_mean_hor_support(self, events_per_sequence, tirp_stat=None):
+        return tirp_stat.get_mean_hor_support(events_per_sequence)
+
+    def get_ver_support(self, tirp_stat=None):
+        return tirp_stat.get_ver_support(self.n_sequences)
+
+    def get_support(self):
+        """
+        returns the vertical support of 1-lenght pattern
+        """
+        return self.definitive_discovered_tirp_dict[" "].sum_ver_supp
+
+    def join(self, f, ps, eps, min_gap=0, max_gap=MAXGAP, max_duration=MAXDURATION, min_ver_sup=0, min_confidence=0.9):
+        """
+        Performs a join between self and f, see VertTirpSidList.join
+        :param f: sidlist of length 1 to extend with
+        :param ps: a pairing strategy (AllenPairing)
+        :param eps: an epsilon to avoid a crispness in allen relations
+        :param min_gap: minimum gap in seconds allowed between consecutive elements of an occurrence of the sequence
+        :param max_gap: maximum gap in seconds allowed between consecutive elements of an occurrence of the sequence
+        :param max_duration: maximum duration in seconds of a tirp
+        :param min_ver_sup: minimum vertical support
+        :param min_confidence: minimum confidence, -1 for none
+        :return: a new sidlist, that is an extension of self with f
+        """
+        table, time_mode, k = self.table, self.time_mode, self.seq_length
+        new_sidlist = ColumnarSidList(table, time_mode)
+        new_sidlist.seq_str = self.seq_str + [f.seq_str[0]]
+        new_sidlist.seq_length = k + 1
+        new_sidlist.n_sequences = self.n_sequences
+        new_sidlist.elements = np.empty((0, k + 1), dtype=np.int64)
+        # whether to mine the last equal relation, to avoid mining A=A, or B=A when A=B have been mined previously
+        mine_last_equal = self.seq_str[-1] < f.seq_str[0]
+
+        # the tirps are grouped per (sequence, event id of the last interval), the first tirp of a group determines
+        # the window of intervals of f that are tried
+        last = self.elements[:, -1]
+        sid, eid = table.sid[last], table.eid[last]
+        heads = np.flatnonzero(np.r_[True, (sid[1:] != sid[:-1]) | (eid[1:] != eid[:-1])])
+        group_size = np.diff(np.r_[heads, len(last)])
+        head_sid, head_eid = sid[heads], eid[heads]
+        me_first = self.first[heads] + time_offset(min_gap, time_mode)
+
+        # the intervals of f are in order of sequence and event id, so also of sequence and start time
+        f_rows = f.elements[:, 0]
+        f_sid, f_eid, f_start = table.sid[f_rows], table.eid[f_rows], table.start[f_rows]
+        low = grouped_searchsorted(f_sid, f_eid, head_sid, head_eid, 'right')
+        sequence_end = np.searchsorted(f_sid, head_sid, 'right')
+        if max_gap != MAXGAP:
+            me_second = me_first + time_offset(max_gap, time_mode)
+            high = grouped_searchsorted(f_sid, f_start, head_sid, me_second, 'right')
+        else:
+            high = sequence_end
+        if min_gap > 0:
+            # the last interval of f in the sequence should meet the min gap restriction
+            last_start = f_start[np.maximum(sequence_end - 1, 0)]
+            high = np.where((sequence_end > 0) & (last_start >= me_first), high, low)
+
+        # candidates: every tirp of a group with every interval of f in the window of the group, in the order in which
+        # VertTirpSidList.join tries them
+        pair_group, pair_f = expand_ranges(low, high)
+        if len(pair_group) == 0:
+            return new_sidlist
+        cand_pair, cand_row = expand_ranges(heads[pair_group], heads[pair_group] + group_size[pair_group])
+        b = f_rows[pair_f[cand_pair]]
+        b_start, b_end = table.start[b], table.end[b]
+        a = self.elements[cand_row, -1]
+
+        # relation with the last interval
+        new_rels = np.empty((len(cand_row), k), dtype=np.int8)
+        new_rels[:, k - 1], status = calc_rel(table.start[a], table.end[a], b_start, b_end, ps.rels_arr, ps.gr_arr,
+                                              eps, min_gap, max_gap, time_mode)
+        if not mine_last_equal:
+            status[new_rels[:, k - 1] == CODE['e']] = 1
+        alive = status == 3
+
+        # max duration constraint
+        new_max_last = np.maximum(b_end, self.max_last[cand_row])
+        too_long = alive & (seconds(new_max_last - self.first[cand_row], time_mode) > max_duration)
+        status[too_long] = 1
+        alive &= ~too_long
+
+        # relations with the other intervals, from the last but one to the first
+        rel_chars = self.relation_codes()
+        for j in range(k - 2, -1, -1):
+            rows = np.flatnonzero(alive)
+            if len(rows) == 0:
+                break
+            a = self.elements[cand_row[rows], j]
+            if ps.trans:
+                rel_ab = np.column_stack([rel_chars[self.rel[cand_row[rows]], (j + 1) * j // 2 + j],
+                                          new_rels[rows, j + 1]])
+                rel, rel_status = assign_rel(ps, rel_ab, table.start[a], table.end[a], b_start[rows], b_end[rows],
+                                             eps, min_gap, max_gap, time_mode)
+            else:
+                rel, rel_status = calc_rel(table.start[a], table.end[a], b_start[rows], b_end[rows], ps.rels_arr,
+                                           ps.gr_arr, eps, min_gap, max_gap, time_mode)
+            new_rels[rows, j] = rel
+            status[rows] = rel_status
+            alive[rows] = rel_status == 3
+
+        # the intervals of f are tried in order until all tirps of the group exceed the max gap with one of them
+        pair_starts = np.flatnonzero(np.r_[True, cand_pair[1:] != cand_pair[:-1]])
+        pair_alive = np.logical_or.reduceat(alive, pair_starts)
+        pair_max_gap = np.logical_and.reduceat(status == 2, pair_starts)
+        exceeded = (pair_max_gap & ~pair_alive).astype(np.int64)
+        group_starts = np.flatnonzero(np.r_[True, pair_group[1:] != pair_group[:-1]])
+        exceeded_before = np.cumsum(exceeded) - exceeded
+        exceeded_before -= np.repeat(exceeded_before[group_starts], np.diff(np.r_[group_starts, len(pair_group)]))
+        found = np.flatnonzero(alive & (exceeded_before[cand_pair] == 0))
+
+        if len(found) == 0:
+            return new_sidlist
+        rows = cand_row[found]
+        elements = np.column_stack([self.elements[rows], b[found]])
+        combinations, rel = np.unique(np.column_stack([self.rel[rows], new_rels[found]]), axis=0, return_inverse=True)
+        rel = rel.ravel()
+        new_sid, new_eid = table.sid[b[found]], table.eid[b[found]]
+        gen = np.arange(len(found))
+
+        # a relation becomes frequent at the tirp at which its vertical support (and confidence) reaches the minimum,
+        # from then on its tirps are kept in the sidlist
+        in_new_sequence = ~pd.Series(rel * len(table.sequences) + new_sid).duplicated().to_numpy()
+        ver_supp = pd.Series(in_new_sequence.astype(np.int64)).groupby(rel).cumsum().to_numpy()
+        frequent = ver_supp >= min_ver_sup
+        if min_confidence != -1:
+            father_supp = np.array([self.definitive_discovered_tirp_dict[self.rels[parent] or " "].sum_ver_supp
+                                    for parent in combinations[:, 0]])
+            frequent &= (ver_supp / father_supp[rel]) >= min_confidence
+        frequent_rels, frequent_at = np.unique(rel[frequent], return_index=True)
+        frequent_at = np.flatnonzero(frequent)[frequent_at]
+        if len(frequent_rels) == 0:
+            return new_sidlist
+        order = np.argsort(frequent_at, kind='stable')
+        frequent_rels, frequent_at = frequent_rels[order], frequent_at[order]
+        new_code = np.full(len(combinations), -1)
+        new_code[frequent_rels] = np.arange(len(frequent_rels))
+        keep = np.flatnonzero(new_code[rel] >= 0)
+
+        # the order of the tirps in the sidlist: the tirps found before a relation became frequent are copied at once,
+        # per sequence and event id in order of appearance, the tirps found after it are added one by one
+        rel, gen, new_sid, new_eid = new_code[rel[keep]], gen[keep], new_sid[keep], new_eid[keep]
+        became_frequent = frequent_at[rel]
+        added = np.where(gen <= became_frequent, became_frequent, gen)
+        key = new_sid * (table.eid.max() + 1) + new_eid
+        sid_seen = pd.Series(gen).groupby([rel, new_sid]).transform('min').to_numpy()
+        key_seen = pd.Series(gen).groupby([rel, key]).transform('min').to_numpy()
+        insertion = np.empty(len(keep), dtype=np.int64)
+        insertion[np.lexsort((gen, key_seen, sid_seen, added))] = np.arange(len(keep))
+        sid_rank = pd.Series(insertion).groupby(new_sid).transform('min').to_numpy()
+        key_rank = pd.Series(insertion).groupby(key).transform('min').to_numpy()
+
+        # the list of a (sequence, event id) starts with the tirps that were added first, later tirps are put in front
+        # of the list if they end after the first tirp of the list, and appended otherwise
+        by_list = np.lexsort((insertion, key_rank))
+        list_starts = np.flatnonzero(np.r_[True, key[by_list][1:] != key[by_list][:-1]])
+        first_of_list = np.empty(len(keep), dtype=np.int64)
+        first_of_list[by_list] = np.repeat(by_list[list_starts], np.diff(np.r_[list_starts, len(keep)]))
+        initial = added == added[first_of_list]
+        later = by_list[~initial[by_list]]
+        max_last = new_max_last[found][keep]
+        front = np.zeros(len(keep), dtype=bool)
+        if len(later) > 0:
+            values = pd.Series(max_last[later])
+            running = values.groupby(key[later], sort=False).cummax().to_numpy()
+            previous = max_last[first_of_list[later]]
+            same_list = key[later][1:] == key[later][:-1]
+            previous[1:][same_list] = np.maximum(previous[1:][same_list], running[:-1][same_list])
+            front[later] = max_last[later] > previous
+        section = np.where(front, 0, np.where(initial, 1, 2))
+        position = np.lexsort((np.where(front, -insertion, insertion), section, key_rank, sid_rank))
+
+        kept = found[keep][position]
+        new_sidlist.elements = elements[keep][position]
+        new_sidlist.rel = rel[position]
+        new_sidlist.rels = [self.rels[combinations[r, 0]] + ''.join(RELATIONS[c] for c in combinations[r, 1:])
+                            for r in frequent_rels]
+        new_sidlist.first = self.first[cand_row[kept]]
+        new_sidlist.max_last = max_last[position]
+        new_sidlist.gen = gen[position]
+        for code, rel_str in enumerate(new_sidlist.rels):
+            new_sidlist.definitive_discovered_tirp_dict[rel_str] = ColumnarTirpStatistics(new_sidlist, code)
+        return new_sidlist
+
+    def relation_codes(self):
+        """
+        :return: an array with the relation codes of every relation string in rels, per position
+        """
+        size_rel = self.seq_length * (self.seq_length - 1) // 2
+        codes = np.zeros((len(self.rels), max(size_rel, 1)), dtype=np.int8)
+        for i, rel_str in enumerate(self.rels):
+            codes[i, :len(rel_str)] = [CODE[r] for r in rel_str]
+        return codes
+
+
+class ColumnarTirpStatistics:
+    """
+    The statistics of the tirps of one relation of a ColumnarSidList, with the interface of TIRPstatistics
+    """
+
+    __slots__ = ['sidlist', 'code', 'sum_ver_supp', 'time_mode']
+
+    def __init__(self, sidlist, code):
+        self.sidlist = sidlist
+        self.code = code
+        self.time_mode = sidlist.time_mode
+        # vertical support, i.e. number of sequences having the pattern p
+        self.sum_ver_supp = len(np.unique(self.sequence_codes(self.rows())))
+
+    def rows(self):
+        # the tirps in the order in which they were found
+        rows = np.flatnonzero(self.sidlist.rel == self.code)
+        return rows[np.argsort(self.sidlist.gen[rows], kind='stable')]
+
+    def sequence_codes(self, rows):
+        return self.sidlist.table.sid[self.sidlist.elements[rows, -1]]
+
+    def per_sequence(self):
+        """
+        :return: the rows of the tirps, split per sequence in order of appearance, and the sequence codes
+        """
+        rows = self.rows()
+        codes, sequences = pd.factorize(self.sequence_codes(rows))
+        order = np.argsort(codes, kind='stable')
+        return np.split(rows[order], np.cumsum(np.bincount(codes))[:-1]), sequences
+
+    def get_instances(self):
+        """
+        Returns all instances of the tirp
+        :return: a generator of (sequence id, tirp) tuples, like TIRPstatistics.get_instances
+        """
+        sidlist, table = self.sidlist, self.sidlist.table
+        r = sidlist.rels[self.code]
+        for rows, sequence in zip(*self.per_sequence()):
+            eids = table.eid[sidlist.elements[rows, -1]]
+            for row in rows[np.argsort(pd.factorize(eids)[0], kind='stable')]:
+                tis = [table.tis[i] for i in sidlist.elements[row]]
+                yield table.sequences[sequence], tirp_of(tis, r)
+
+    def get_mean_hor_support(self, events_per_sequence):
+        """
+        :param events_per_sequence: a dictionary where key is a sequence id and value is number of items in sequence
+        :return: returns the horizontal support
+        """
+        rel_sum = 0.0
+        for rows, sequence in zip(*self.per_sequence()):
+            rel_sum += len(rows) / events_per_sequence[self.sidlist.table.sequences[sequence]]
+        return rel_sum / self.sum_ver_supp
+
+    def get_ver_support(self, n_sequences):
+        return self.sum_ver_supp / n_sequences
+
+    def get_mean_duration(self):
+        """
+        :return: returns the mean duration vector, with the mean duration of the tirps in each sequence
+        """
+        durations = seconds(self.sidlist.max_last - self.sidlist.first, self.time_mode)
+        return [sum(durations[rows].tolist()) / len(rows) for rows in self.per_sequence()[0]]
+
+    def get_mean_of_means_duration(self, units="hours"):
+        if self.time_mode == 1 or self.time_mode == 2:
+            switcher = {"seconds": 1, "minutes": 60, "hours": 60 * 60,
+                        "days": 60 * 60 * 24, "weeks": 60 * 60 * 24 * 7,
+                        "years": 60 * 60 * 24 * 365}
+            return str(np.mean(self.get_mean_duration()) / switcher.get(units, 1)) + " " + units
+        else:
+            return str(np.mean(self.get_mean_duration()))
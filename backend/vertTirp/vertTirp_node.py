@@ -76,6 +76,50 @@ class VertTirpNode:
             n.print_tree_dfs(min_len, o_file,events_per_sequence)
 
 
+    def collect_occurrences(self, min_len, occurrences):
+        """
+        Collects in depth first search manner (the order of print_tree_dfs) the discovered tirps with their statistics
+        :param min_len: minimum pattern length to be collected
+        :param occurrences: a list to which (symbols, relation string, sidlist, tirp statistics) tuples are appended
+        :return: appends the tirps of this node and its descendants to occurrences
+        """
+        if self.pat_len >= min_len:
+            for rel, tirp_stat in self.sidlist.definitive_discovered_tirp_dict.items():
+                occurrences.append((self.sidlist.seq_str, rel, self.sidlist, tirp_stat))
+
+        for n in self.child_nodes:
+            n.collect_occurrences(min_len, occurrences)
+
+    def count_tirps(self, min_len):
+        """
+        :param min_len: minimum pattern length to be counted
+        :return: the number of tirps of this node and its descendants
+        """
+        count = 0
+        if self.pat_len >= min_len and self.sidlist is not None:
+            count = len(self.sidlist.definitive_discovered_tirp_dict)
+        for n in self.child_nodes:
+            count += n.count_tirps(min_len)
+        return count
+
+    def remove_symbols(self, symbols):
+        """
+        Removes the descendants whose pattern includes one of the symbols
+        :param symbols: a set of symbols
+        """
+        self.child_nodes = [n for n in self.child_nodes if n.sidlist.seq_str[-1] not in symbols]
+        for n in self.child_nodes:
+            n.remove_symbols(symbols)
+
+    def collect_sidlists(self, sidlists):
+        """
+        Appends the sidlists of this node and its descendants to sidlists
+        """
+        if self.sidlist is not None:
+            sidlists.append(self.sidlist)
+        for n in self.child_nodes:
+            n.collect_sidlists(sidlists)
+
     def analyze_patterns_rec(self,rels_pos,global_arr):
         """
         A function useful to analyze 2-lenght patterns to discover the best pairing strategy
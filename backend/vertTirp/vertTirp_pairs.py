@@ -0,0 +1,145 @@
+"""
+Sweep-line mining of the tirps of two time intervals, used by VertTIRP.mine_pairs instead of the depth first search
+when only patterns of length 2 are needed (e.g. the pattern view of the server).
+
+The intervals of all sequences are swept once in order of sequence and event id: every time interval is paired with
+the intervals that follow it within the max gap window, for all frequent symbols at once, instead of joining the sidlist
+of every frequent symbol with the sidlist of every other one. The pairs of the whole sweep are tested with the vectorized
+relations of vertTirp_columnar, as VertTirpSidList.join tests them (the same window, the same break once the max gap is
+exceeded, the same relations and min gap and max duration constraints), and only the instances of the frequent
+relations become TIRP objects, so the tree holds the same tirps and statistics as the depth first search with
+max_length=2.
+"""
+
+import numpy as np
+from vertTirp.tirp.tirp import TIRP
+from vertTirp.tirp.tirp_statistics import TIRPstatistics
+from vertTirp.vertTirp_sidlist import VertTirpSidList, MAXGAP
+from vertTirp.vertTirp_columnar import RELATIONS, CODE, calc_rel, expand_ranges, grouped_searchsorted, seconds, \
+    time_offset
+
+
+def sweep(table, extensions, allen, eps, min_gap, max_gap, max_duration, min_ver_sup, min_confidence, supports):
+    """
+    Pairs every time interval with the intervals that follow it in its sequence within the max gap window, and keeps
+    the instances of the frequent relations of every pair of symbols
+
+    :param table: an IntervalTable with the intervals of all sequences
+    :param extensions: a dict where key is a frequent symbol and value is the set of symbols to extend it with
+    :param allen: the pairing strategy (AllenPairing)
+    :param min_ver_sup: minimum vertical support
+    :param min_confidence: minimum confidence, -1 to not use it
+    :param supports: a dict where key is a frequent symbol and value is its vertical support, necessary for
+    confidence calculation
+    :return: a dict where key is a (symbol, symbol) pair and value is a tuple of its frequent relations, in the order
+    in which they became frequent, and the list of their instances (sequence id, first TI, second TI, event id of the
+    second TI, relation), in the order in which VertTirpSidList.join finds them
+    """
+    time_mode = table.time_mode
+    # symbol codes in lexicographic order, so that the codes compare like the symbols
+    names = sorted({ti.sym for ti in table.tis})
+    code = {name: c for c, name in enumerate(names)}
+    sym = np.array([code[ti.sym] for ti in table.tis], dtype=np.int64)
+    allowed = np.zeros((len(names), len(names)), dtype=bool)
+    for a_sym, b_syms in extensions.items():
+        for b_sym in b_syms:
+            if a_sym in code and b_sym in code:
+                allowed[code[a_sym], code[b_sym]] = True
+
+    # the window of every interval that is extended: the next intervals of its sequence that start at most at
+    # me_second (the intervals are in order of sequence and event id, so also of sequence and start time)
+    rows = np.flatnonzero(allowed.any(axis=1)[sym])
+    me_first = table.start[rows] + time_offset(min_gap, time_mode)
+    if max_gap != MAXGAP:
+        high = grouped_searchsorted(table.sid, table.start, table.sid[rows],
+                                    me_first + time_offset(max_gap, time_mode), 'right')
+    else:
+        high = np.searchsorted(table.sid, table.sid[rows], 'right')
+    pair_a, j = expand_ranges(rows + 1, high)
+    i = rows[pair_a]
+    keep = allowed[sym[i], sym[j]]
+    if min_gap > 0:
+        # a join skips the sequence if the last interval of the symbol starts before the min gap
+        last_start = dict()
+        for sid, s, start in zip(table.sid.tolist(), sym.tolist(), table.start.tolist()):
+            last_start[(sid, s)] = start
+        last = np.array([last_start[key] for key in zip(table.sid[j].tolist(), sym[j].tolist())],
+                        dtype=table.start.dtype)
+        keep &= last >= me_first[pair_a]
+    i, j = i[keep], j[keep]
+
+    rel, status = calc_rel(table.start[i], table.end[i], table.start[j], table.end[j], allen.rels_arr, allen.gr_arr,
+                           eps, min_gap, max_gap, time_mode)
+    # the last equal relation is only mined once, for the symbols in lexicographic order
+    status[(rel == CODE['e']) & (sym[i] >= sym[j])] = 1
+    # once the max gap is exceeded, the join does not try the next intervals of the symbol
+    key = i * len(names) + sym[j]
+    exceeded_keys, first = np.unique(key[status == 2], return_index=True)
+    limit = np.full(len(key), len(table.tis), dtype=np.int64)
+    if len(exceeded_keys):
+        pos = np.minimum(np.searchsorted(exceeded_keys, key), len(exceeded_keys) - 1)
+        found = exceeded_keys[pos] == key
+        limit[found] = j[status == 2][first][pos[found]]
+    # max duration constraint
+    duration = seconds(np.maximum(table.end[i], table.end[j]) - table.start[i], time_mode)
+    keep = (status == 3) & (j < limit) & (duration <= max_duration)
+    i, j, rel = i[keep], j[keep], rel[keep].astype(np.int64)
+
+    # a relation of a pair becomes frequent with the instance that adds the min_ver_sup-th sequence (if it meets
+    # the confidence constraint as well), the instances are in the order of the joins within every pair
+    group = (sym[i] * len(names) + sym[j]) * len(RELATIONS) + rel
+    n_sequences = len(table.sequences)
+    firsts = np.sort(np.unique(group * n_sequences + table.sid[i], return_index=True)[1])
+    first_group = group[firsts]
+    order = np.argsort(first_group, kind='stable')
+    firsts, first_group = firsts[order], first_group[order]
+    group_start = np.r_[0, np.flatnonzero(first_group[1:] != first_group[:-1]) + 1]
+    vert_supp = np.arange(1, len(firsts) + 1) - np.repeat(group_start, np.diff(np.r_[group_start, len(firsts)]))
+    frequent = vert_supp >= min_ver_sup
+    if min_confidence != -1:
+        father_supp = np.array([supports.get(name, 1) for name in names], dtype=np.float64)
+        frequent &= (vert_supp / father_supp[first_group // len(RELATIONS) // len(names)]) >= min_confidence
+    frequent_groups, frequent_at = np.unique(first_group[frequent], return_index=True)
+    frequent_at = firsts[frequent][frequent_at]
+
+    candidates = dict()
+    for g in frequent_groups[np.argsort(frequent_at, kind='stable')].tolist():
+        pair = (names[g // len(RELATIONS) // len(names)], names[g // len(RELATIONS) % len(names)])
+        if pair not in candidates:
+            candidates[pair] = ([], [])
+        candidates[pair][0].append(RELATIONS[g % len(RELATIONS)])
+    keep = np.isin(group, frequent_groups)
+    i, j, rel = i[keep], j[keep], rel[keep]
+    sids, eids = table.sid[i].tolist(), table.eid[j].tolist()
+    for sid, a_ti, b_ti, b_eid, r in zip(sids, table.tis[i], table.tis[j], eids, rel.tolist()):
+        candidates[(a_ti.sym, b_ti.sym)][1].append((table.sequences[sid], a_ti, b_ti, b_eid, RELATIONS[r]))
+    return candidates
+
+
+def pair_sidlist(pair, relations, instances, time_mode, n_sequences):
+    """
+    Builds the sidlist of a pair of symbols with the statistics of its frequent relations
+
+    :param pair: a (symbol, symbol) tuple
+    :param relations: the frequent relations of the pair, in the order in which they became frequent
+    :param instances: the instances of the frequent relations, see sweep
+    :param time_mode: 1- timestamp mode, 2- datetime mode 3- number mode(e.g. number of frame)
+    :param n_sequences: total number of sequences
+    :return: a sidlist with the frequent relations in its definitive_discovered_tirp_dict (its
+    definitive_ones_indices_dict is not filled, it is not extended further)
+    """
+    sidlist = VertTirpSidList(time_mode)
+    sidlist.seq_str = list(pair)
+    sidlist.seq_length = 2
+    sidlist.set_n_sequences(n_sequences)
+    for rel in relations:
+        sidlist.definitive_discovered_tirp_dict[rel] = TIRPstatistics(time_mode)
+    # the instances of the first time interval, shared by all its pairs
+    firsts = dict()
+    for sid, a, b, b_eid, rel in instances:
+        if id(a) not in firsts:
+            firsts[id(a)] = TIRP(a, a.start, a.end)
+        max_last = b.end if b.end >= a.end else a.end
+        tirp = TIRP(b, a.start, max_last, rel, firsts[id(a)])
+        sidlist.definitive_discovered_tirp_dict[rel].append_tirp(sid, b_eid, tirp)
+    return sidlist
@@ -20,14 +20,16 @@ Keywords: Time Interval Related Patterns; Temporal data mining; Sequential patte
 """
 
 import numpy as np
+from bisect import bisect_right
 from vertTirp.tirp.tirp import TIRP
 from vertTirp.tirp.tirp_statistics import TIRPstatistics
 
 MAXGAP = 3155695200
 MAXDURATION = 3155695200
 
-__slots__ = ['time_mode', 'seq_str', 'seq_length', 'definitive_ones_indices_dict','definitive_discovered_tirp_dict', 'temp_discovered_tirp_dict', 'n_sequences']
 class VertTirpSidList:
+    __slots__ = ['time_mode', 'seq_str', 'seq_length', 'definitive_ones_indices_dict', 'definitive_discovered_tirp_dict',
+                 'temp_discovered_tirp_dict', 'n_sequences', 'support', 'sequence_eids', 'sequence_firsts']
 
     def __init__(self, time_mode=False):
 
@@ -50,6 +52,11 @@ class VertTirpSidList:
         self.temp_discovered_tirp_dict = dict()
         self.n_sequences = 0
 
+        # only for sidlists of length 1 (the ones to extend with): where key is sequence id and value is the sorted
+        # list of its event ids, and the list of their start times (also sorted, as event ids follow the start times)
+        self.sequence_eids = dict()
+        self.sequence_firsts = dict()
+
     def append_item(self, ti, sid, eid):
         """
         Method called during V(DB) creation, that adds a tirp to the sidlist
@@ -61,7 +68,7 @@ class VertTirpSidList:
         :param first_item: if it is set to True it is a new sidlist, otherwise it is an existent one.
         :return: Nothing. A tirp was added to the sidlist
         """
-        new_tirp = TIRP([ti], ti.start, ti.end, r=[])
+        new_tirp = TIRP(ti, ti.start, ti.end)
 
         if not self.definitive_discovered_tirp_dict:
             self.definitive_discovered_tirp_dict[" "] = TIRPstatistics(self.time_mode)
@@ -70,14 +77,30 @@ class VertTirpSidList:
 
         if not sid in self.definitive_ones_indices_dict:
             self.definitive_ones_indices_dict[sid] = dict()
+            self.sequence_eids[sid] = []
+            self.sequence_firsts[sid] = []
 
         self.definitive_discovered_tirp_dict[" "].append_tirp(sid, eid, new_tirp)
 
         if not (eid in self.definitive_ones_indices_dict[sid]):
             self.definitive_ones_indices_dict[sid][eid] = [new_tirp]
+            self.sequence_eids[sid].append(eid)
+            self.sequence_firsts[sid].append(new_tirp.first)
         else:
             self.definitive_ones_indices_dict[sid][eid].append(new_tirp)
 
+    def remap_eids(self, remap):
+        """
+        Renumbers the event ids of the sidlist and of the statistics of its tirps
+        :param remap: a dict where key is a sequence id and value is a list with the new event id of every old one
+        :return: Nothing. The event ids have been replaced, keeping the order of the dicts
+        """
+        self.definitive_ones_indices_dict = {sid: {remap[sid][eid]: tirps for eid, tirps in eid_tirps.items()}
+                                             for sid, eid_tirps in self.definitive_ones_indices_dict.items()}
+        self.sequence_eids = {sid: [remap[sid][eid] for eid in eids] for sid, eids in self.sequence_eids.items()}
+        for tirp_stat in self.definitive_discovered_tirp_dict.values():
+            tirp_stat.remap_eids(remap)
+
     def set_n_sequences(self,n_sequences):
         self.n_sequences = n_sequences
 
@@ -137,9 +160,10 @@ class VertTirpSidList:
 
         for seq_id, dict_pos_tirps in self.definitive_ones_indices_dict.items():
             if seq_id in f.definitive_ones_indices_dict:
-                f_eids = list(f.definitive_ones_indices_dict[seq_id].keys())
-                last_f_first = f.definitive_ones_indices_dict[seq_id][f_eids[-1]][0].first
-                first_f_first = f.definitive_ones_indices_dict[seq_id][f_eids[0]][0].first
+                f_eids = f.sequence_eids[seq_id]
+                f_firsts = f.sequence_firsts[seq_id]
+                last_f_first = f_firsts[-1]
+                first_f_first = f_firsts[0]
                 for self_first_eid, self_tirps in dict_pos_tirps.items():
                     # if there exists eids in f greater than my first eid
                     if self_first_eid < f_eids[-1]:
@@ -170,18 +194,21 @@ class VertTirpSidList:
                                     ((max_gap != MAXGAP) and
                                      first_f_first <= me_second):
 
-                                f_dict_pos_tirps = f.definitive_ones_indices_dict[seq_id]
-                                for f_pos, f_tirps in f_dict_pos_tirps.items():
-                                    if (max_gap != MAXGAP) and f_tirps[0].first > me_second:
+                                # binary search of the window of f event ids to try: the ones after my first eid
+                                # that start at most at me_second
+                                lo = bisect_right(f_eids, self_first_eid)
+                                if max_gap != MAXGAP:
+                                    hi = bisect_right(f_firsts, me_second, lo)
+                                else:
+                                    hi = len(f_eids)
+
+                                for i in range(lo, hi):
+                                    ext_status = new_sidlist.update_tirp_attrs(seq_id, f_eids[i], f, mine_last_equal, ps, self_tirps, eps, min_gap, max_gap, max_duration, min_ver_sup,self.definitive_discovered_tirp_dict,min_confidence)
+                                    if ext_status == 2:
+                                        # max_gap exceeded for all the tirps, break and
+                                        # continue with another 1 of the self sequence
+                                        # no sense prove out the next s event id, as max gap exceeded
                                         break
-                                    else:
-                                        if f_pos > self_first_eid:
-                                            ext_status = new_sidlist.update_tirp_attrs(seq_id, f_pos, f, mine_last_equal, ps, self.definitive_ones_indices_dict[seq_id][self_first_eid], eps, min_gap, max_gap, max_duration, min_ver_sup,self.definitive_discovered_tirp_dict,min_confidence)
-                                            if ext_status == 2:
-                                                # max_gap exceeded for all the tirps, break and
-                                                # continue with another 1 of the self sequence
-                                                # no sense prove out the next s event id, as max gap exceeded
-                                                break
         del new_sidlist.temp_discovered_tirp_dict
         return new_sidlist
 
@@ -208,7 +235,7 @@ class VertTirpSidList:
         """
 
         # time interval that will be added to each tirp_to_extend
-        f_ti = f_sidlist.definitive_ones_indices_dict[seq_id][f_eid][0].ti
+        f_ti = f_sidlist.definitive_ones_indices_dict[seq_id][f_eid][0].last
 
         all_max_gap_exceeded = True
         at_least_one_tirp = False
@@ -217,7 +244,7 @@ class VertTirpSidList:
 
             # the extension will return a new tirp and a status
             # status is: if ok:3, if max_gap: 2, otherwise: 1
-            new_tirp, status = tirp_to_extend.extend_with(f_ti[0], eps, min_gap, max_gap, max_duration, self.time_mode, mine_last_equal, ps)
+            new_tirp, status = tirp_to_extend.extend_with(f_ti, eps, min_gap, max_gap, max_duration, self.time_mode, mine_last_equal, ps)
 
             if new_tirp is not None:
                 at_least_one_tirp = True